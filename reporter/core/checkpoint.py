@@ -0,0 +1,150 @@
+import json
+import os
+import queue
+import random
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy
+import torch
+
+
+def capture_rng_state() -> Dict[str, Any]:
+    return {'python': random.getstate(),
+            'numpy': numpy.random.get_state(),
+            'torch': torch.get_rng_state(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None}
+
+
+def restore_rng_state(state: Dict[str, Any]) -> None:
+    random.setstate(state['python'])
+    numpy.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state.get('cuda') is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def load_checkpoint(src: Path, device: torch.device) -> Dict[str, Any]:
+    with src.open(mode='rb') as f:
+        return torch.load(f, map_location=device)
+
+
+def _snapshot(obj: Any) -> Any:
+    '''Copy tensors to CPU so that training can keep updating them in place
+    while the copy is being written
+    '''
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().cpu().clone()
+    elif isinstance(obj, dict):
+        return type(obj)((k, _snapshot(v)) for (k, v) in obj.items())
+    elif isinstance(obj, list):
+        return [_snapshot(v) for v in obj]
+    elif isinstance(obj, tuple):
+        return tuple(_snapshot(v) for v in obj)
+    else:
+        return obj
+
+
+class CheckpointWriter:
+    '''Serialize objects by ``torch.save`` on a background thread
+
+    Objects are snapshotted on the caller's thread, and written in the order they are given.
+    Each file is written to a temporary path and renamed, so a crash never leaves a partial file.
+    At most one write waits in the queue, so a slow disk throttles training
+    instead of accumulating snapshots in memory.
+    '''
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def save(self, dest: Path, obj: Any) -> None:
+        self._raise_if_failed()
+        self.queue.put((dest, _snapshot(obj)))
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_if_failed()
+
+    def _work(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            (dest, obj) = item
+            try:
+                _save_atomically(dest, obj)
+            except Exception as e:  # re-raised on the training thread
+                self.error = e
+
+    def _raise_if_failed(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+def _save_atomically(dest: Path, obj: Any) -> None:
+    tmp = dest.with_name(dest.name + '.tmp')
+    with tmp.open(mode='wb') as f:
+        torch.save(obj, f)
+    os.replace(str(tmp), str(dest))
+
+
+# Tensors in a flat file start at multiples of a cache line
+FLAT_ALIGNMENT = 64
+
+
+def export_flat_weights(state_dict: Dict[str, torch.Tensor], dest: Path) -> None:
+    '''Write the floating-point tensors of ``state_dict`` into one flat float32 file
+
+    Their offsets and shapes are written to `<dest>.json`.
+    '''
+    index = dict()
+    offset = 0
+    tmp = dest.with_name(dest.name + '.tmp')
+    with tmp.open(mode='wb') as f:
+        for (name, tensor) in state_dict.items():
+            if not tensor.is_floating_point():
+                continue
+            padding = -offset % FLAT_ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            data = tensor.detach().cpu().to(torch.float32).contiguous().numpy().tobytes()
+            f.write(data)
+            index[name] = {'offset': offset, 'shape': list(tensor.shape)}
+            offset += len(data)
+    _save_index_atomically(dest.with_name(dest.name + '.json'), index)
+    os.replace(str(tmp), str(dest))
+
+
+def _save_index_atomically(dest: Path, index: Dict[str, Any]) -> None:
+    tmp = dest.with_name(dest.name + '.tmp')
+    with tmp.open(mode='w') as f:
+        json.dump(index, f)
+    os.replace(str(tmp), str(dest))
+
+
+def map_flat_weights(model: torch.nn.Module, src: Path) -> None:
+    '''Replace the parameters and buffers of ``model`` on CPU by views of a file written by
+    :func:`export_flat_weights`
+
+    The file is mapped copy-on-write, so every process mapping it shares the same pages
+    of the page cache until it writes to them.
+    '''
+    with src.with_name(src.name + '.json').open(mode='r') as f:
+        index = json.load(f)
+    mm = numpy.memmap(str(src), dtype=numpy.uint8, mode='c')
+
+    tensors = dict(model.named_parameters())
+    tensors.update(model.named_buffers())
+    for (name, entry) in index.items():
+        if name not in tensors:
+            continue
+        shape = entry['shape']
+        n_bytes = int(numpy.prod(shape, dtype=numpy.int64)) * 4
+        view = mm[entry['offset']:entry['offset'] + n_bytes].view(numpy.float32).reshape(shape)
+        tensors[name].data = torch.from_numpy(view)
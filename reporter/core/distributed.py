@@ -0,0 +1,54 @@
+import os
+from typing import Generator, Iterable
+
+import torch
+import torch.distributed as dist
+from torchtext.data import Batch
+
+DEFAULT_MASTER_ADDR = '127.0.0.1'
+DEFAULT_MASTER_PORT = '29500'
+
+
+def setup_process_group(rank: int, world_size: int) -> None:
+    '''Join the local process group over gloo
+
+    Each worker keeps an equal share of the CPU threads,
+    since intra-op parallelism scales poorly for our small layers.
+    '''
+    os.environ.setdefault('MASTER_ADDR', DEFAULT_MASTER_ADDR)
+    os.environ.setdefault('MASTER_PORT', DEFAULT_MASTER_PORT)
+    dist.init_process_group('gloo', init_method='env://', rank=rank, world_size=world_size)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+
+
+def cleanup_process_group() -> None:
+    dist.barrier()
+    dist.destroy_process_group()
+
+
+def shard(X: Iterable[Batch], rank: int, world_size: int) -> Iterable[Batch]:
+    '''Deal out batches round-robin to the workers
+
+    The remainder is dropped so that every worker runs the same number of steps,
+    which all-reduce requires.
+    '''
+    if world_size == 1:
+        return X
+    return _shard(X, rank, world_size)
+
+
+def _shard(X: Iterable[Batch], rank: int, world_size: int) -> Generator[Batch, None, None]:
+    n_batches = len(X) - len(X) % world_size
+    for (i, batch) in enumerate(X):
+        if i >= n_batches:
+            return
+        if i % world_size == rank:
+            yield batch
+
+
+def broadcast_flag(flag: bool, src: int = 0) -> bool:
+    '''Share a decision made on ``src`` (e.g. early stopping) with every worker
+    '''
+    t = torch.tensor([int(flag)], dtype=torch.int32)
+    dist.broadcast(t, src=src)
+    return bool(t.item())
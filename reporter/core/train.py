@@ -1,9 +1,10 @@
 from logging import Logger
-from typing import Dict, List
+from typing import Dict, List, Union
 
 import numpy
 import torch
 from nltk.translate.bleu_score import SmoothingFunction, sentence_bleu
+from torch.nn.parallel import DistributedDataParallel
 from torchtext.data import Iterator
 from torchtext.vocab import Vocab
 
@@ -12,9 +13,11 @@ from reporter.core.operation import (
     get_latest_closing_vals,
     replace_tags_with_vals
 )
+from reporter.postprocessing.attention import AttentionWriter
 from reporter.postprocessing.text import remove_bos
 from reporter.util.constant import SEED, Code, Phase, SeqType, SpecialToken
 from reporter.util.conversion import stringify_ric_seqtype
+from reporter.util.instrument import Instrument
 from reporter.util.tool import takeuntil
 
 
@@ -35,13 +38,26 @@ class RunResult:
         self.pred_sents_num = pred_sents_num
 
 
+class TrainResult:
+    def __init__(self,
+                 best_epoch: int,
+                 valid_bleu: float,
+                 test_bleu: float):
+
+        self.best_epoch = best_epoch
+        self.valid_bleu = valid_bleu
+        self.test_bleu = test_bleu
+
+
 def run(X: Iterator,
         vocab: Vocab,
-        model: EncoderDecoder,
+        model: Union[EncoderDecoder, DistributedDataParallel],
         optimizer: Dict[SeqType, torch.optim.Optimizer],
         criterion: torch.nn.modules.Module,
         phase: Phase,
-        logger: Logger) -> RunResult:
+        logger: Logger,
+        attn_writer: Union[AttentionWriter, None] = None,
+        instrument: Union[Instrument, None] = None) -> RunResult:
 
     if phase in [Phase.Valid, Phase.Test]:
         model.eval()
@@ -50,13 +66,21 @@ def run(X: Iterator,
 
     numpy.random.seed(SEED)
 
+    network = model.module \
+        if isinstance(model, DistributedDataParallel) \
+        else model
+
+    instrument = Instrument(None) if instrument is None else instrument
+    (name_forward, name_backward, name_step, name_decode, name_logging) = \
+        ['{}.{}'.format(phase.value, name) for name in ['forward', 'backward', 'step', 'decode', 'logging']]
+    i_padding = vocab.stoi[SpecialToken.Padding.value]
+
     accum_loss = 0.0
     all_article_ids = []
     all_gold_sents = []
     all_pred_sents = []
     all_gold_sents_with_number = []
     all_pred_sents_with_number = []
-    attn_weights = []
 
     for batch in X:
 
@@ -69,55 +93,63 @@ def run(X: Iterator,
         latest_closing_vals = get_latest_closing_vals(batch, raw_long_field, times)
         max_n_tokens, _ = tokens.size()
 
+        if instrument.enabled:
+            instrument.count(phase.value + '.examples', batch.batch_size)
+            instrument.count(phase.value + '.tokens', int((tokens != i_padding).sum()))
+
         # Forward
-        loss, pred, attn_weight = model(batch, batch.batch_size, tokens, times, criterion, phase)
+        with instrument.phase(name_forward):
+            loss, pred, attn_weight = model(batch, batch.batch_size, tokens, times, criterion, phase)
 
         if phase == Phase.Train:
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+            with instrument.phase(name_backward):
+                optimizer.zero_grad()
+                loss.backward()
+            with instrument.phase(name_step):
+                optimizer.step()
 
-        if isinstance(model.decoder.attn, Attention):
-            attn_weight = numpy.array(list(zip(*attn_weight)))
-            attn_weights.extend(attn_weight)
+        if attn_writer is not None and isinstance(network.decoder.attn, Attention):
+            attn_writer.write(article_ids, attn_weight)
 
         all_article_ids.extend(article_ids)
 
-        i_eos = vocab.stoi[SpecialToken.EOS.value]
-        # Recover words from ids removing BOS and EOS from gold sentences for evaluation
-        gold_sents = [remove_bos([vocab.itos[i] for i in takeuntil(i_eos, sent)])
-                      for sent in zip(*tokens.cpu().numpy())]
-        all_gold_sents.extend(gold_sents)
+        with instrument.phase(name_decode):
+            i_eos = vocab.stoi[SpecialToken.EOS.value]
+            # Recover words from ids removing BOS and EOS from gold sentences for evaluation
+            gold_sents = [remove_bos([vocab.itos[i] for i in takeuntil(i_eos, sent)])
+                          for sent in zip(*tokens.cpu().numpy())]
+            all_gold_sents.extend(gold_sents)
 
-        pred_sents = [remove_bos([vocab.itos[i] for i in takeuntil(i_eos, sent)]) for sent in zip(*pred)]
-        all_pred_sents.extend(pred_sents)
+            pred_sents = [remove_bos([vocab.itos[i] for i in takeuntil(i_eos, sent)]) for sent in zip(*pred)]
+            all_pred_sents.extend(pred_sents)
 
         if phase == Phase.Test:
-            z_iter = zip(article_ids, gold_sents, pred_sents, latest_vals, latest_closing_vals)
-            for (article_id, gold_sent, pred_sent, latest_val, latest_closing_val) in z_iter:
-
-                bleu = sentence_bleu([gold_sent],
-                                     pred_sent,
-                                     smoothing_function=SmoothingFunction().method1)
-
-                gold_sent_num = replace_tags_with_vals(gold_sent, latest_closing_val, latest_val)
-                all_gold_sents_with_number.append(gold_sent_num)
-
-                pred_sent_num = replace_tags_with_vals(pred_sent, latest_closing_val, latest_val)
-                all_pred_sents_with_number.append(pred_sent_num)
-
-                description = \
-                    '\n'.join(['=== {} ==='.format(phase.value.upper()),
-                               'Article ID: {}'.format(article_id),
-                               'Gold (tag): {}'.format(', '.join(gold_sent)),
-                               'Gold (num): {}'.format(', '.join(gold_sent_num)),
-                               'Pred (tag): {}'.format(', '.join(pred_sent)),
-                               'Pred (num): {}'.format(', '.join(pred_sent_num)),
-                               'BLEU: {:.5f}'.format(bleu),
-                               'Loss: {:.5f}'.format(loss.item() / max_n_tokens),
-                               'Latest: {:.2f}'.format(latest_val),
-                               'Closing: {:.2f}'.format(latest_closing_val)])
-                logger.info(description)  # TODO: info → debug in release
+            with instrument.phase(name_logging):
+                z_iter = zip(article_ids, gold_sents, pred_sents, latest_vals, latest_closing_vals)
+                for (article_id, gold_sent, pred_sent, latest_val, latest_closing_val) in z_iter:
+
+                    bleu = sentence_bleu([gold_sent],
+                                         pred_sent,
+                                         smoothing_function=SmoothingFunction().method1)
+
+                    gold_sent_num = replace_tags_with_vals(gold_sent, latest_closing_val, latest_val)
+                    all_gold_sents_with_number.append(gold_sent_num)
+
+                    pred_sent_num = replace_tags_with_vals(pred_sent, latest_closing_val, latest_val)
+                    all_pred_sents_with_number.append(pred_sent_num)
+
+                    description = \
+                        '\n'.join(['=== {} ==='.format(phase.value.upper()),
+                                   'Article ID: {}'.format(article_id),
+                                   'Gold (tag): {}'.format(', '.join(gold_sent)),
+                                   'Gold (num): {}'.format(', '.join(gold_sent_num)),
+                                   'Pred (tag): {}'.format(', '.join(pred_sent)),
+                                   'Pred (num): {}'.format(', '.join(pred_sent_num)),
+                                   'BLEU: {:.5f}'.format(bleu),
+                                   'Loss: {:.5f}'.format(loss.item() / max_n_tokens),
+                                   'Latest: {:.2f}'.format(latest_val),
+                                   'Closing: {:.2f}'.format(latest_closing_val)])
+                    logger.info(description)  # TODO: info → debug in release
 
         accum_loss += loss.item() / max_n_tokens
 
@@ -0,0 +1,129 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from logging import Logger
+from typing import Dict, Generator, List, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_PATTERNS = [
+    # String literals, and then numbers which are not part of identifiers
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b'), '?'),
+    # Bind parameters of psycopg2, sqlite3, and SQLAlchemy text()
+    (re.compile(r'%\(\w+\)s|%s|(?<!:):\w+|\?'), '?'),
+    # Lists of any length, e.g. of `IN` and `VALUES`
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+    (re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(statement: str) -> str:
+    '''Normalize a statement so that the statements differing only in values are the same
+
+    >>> fingerprint("SELECT * FROM prices WHERE ric = %(ric_1)s AND t IN (1, 2.5, 3)\\n AND x = 'it''s'")
+    'SELECT * FROM prices WHERE ric = ? AND t IN (?) AND x = ?'
+    >>> fingerprint('INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s), (%(a_m1)s, %(b_m1)s)')
+    'INSERT INTO t (a, b) VALUES (?)'
+    >>> fingerprint("SELECT val ::float FROM price_seqs WHERE seqtype = :seqtype0")
+    'SELECT val ::float FROM price_seqs WHERE seqtype = ?'
+    '''
+    for (pattern, replacement) in _PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+class QueryStats:
+    '''The queries of a logical unit, e.g. a Flask request or a stage of the pipeline
+    '''
+
+    def __init__(self, name: str):
+
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+        self.fingerprint_seconds = defaultdict(float)
+
+    def add(self, statement: str, seconds: float) -> None:
+        key = fingerprint(statement)
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[key] += 1
+        self.fingerprint_seconds[key] += seconds
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        '''The fingerprints run more than ``threshold`` times, which suggest queries in a loop (N+1)
+        '''
+        return {key: n for (key, n) in self.fingerprints.most_common() if n > threshold}
+
+    def summary(self) -> str:
+        return '{}: {} queries in {:.3f}s'.format(self.name, self.count, self.seconds)
+
+
+class QueryRecorder:
+    '''Record the queries on engines per logical unit of the current thread
+
+    Queries outside of any unit are not recorded.
+    When a unit ends, the fingerprints run more than ``warn_threshold`` times are logged as warnings.
+    '''
+
+    def __init__(self, logger: Union[Logger, None] = None, warn_threshold: Union[int, None] = None):
+
+        self.logger = logger
+        self.warn_threshold = warn_threshold
+        self.local = threading.local()
+
+    def attach(self, engine: Engine) -> 'QueryRecorder':
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        return self
+
+    def detach(self, engine: Engine) -> None:
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _units(self) -> List[QueryStats]:
+        if not hasattr(self.local, 'units'):
+            self.local.units = []
+        return self.local.units
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        seconds = time.perf_counter() - conn.info['query_start'].pop()
+        # A query of a nested unit counts for the enclosing ones as well
+        for stats in self._units():
+            stats.add(statement, seconds)
+
+    def current(self) -> Union[QueryStats, None]:
+        units = self._units()
+        return units[-1] if len(units) > 0 else None
+
+    def begin(self, name: str) -> QueryStats:
+        stats = QueryStats(name)
+        self._units().append(stats)
+        return stats
+
+    def end(self) -> Union[QueryStats, None]:
+        units = self._units()
+        if len(units) == 0:
+            return None
+        stats = units.pop()
+        if self.logger is not None and self.warn_threshold is not None:
+            for (key, n) in stats.repeated(self.warn_threshold).items():
+                self.logger.warning('{} ran the same query {} times (N+1?): {}'.format(stats.name, n, key))
+        return stats
+
+    @contextmanager
+    def unit(self, name: str) -> Generator[QueryStats, None, None]:
+        stats = self.begin(name)
+        try:
+            yield stats
+        finally:
+            self.end()
@@ -1,11 +1,13 @@
-from datetime import datetime
-from typing import Any
+from datetime import date, datetime, timedelta
+from typing import Any, Tuple
 
 from sqlalchemy import func
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm.query import Query
 from sqlalchemy.sql.functions import Function
 
+from reporter.util.constant import JST
+
 
 def in_jst(timestamp: datetime) -> Function:
     return func.timezone('Asia/Tokyo', timestamp)
@@ -15,6 +17,27 @@ def in_utc(timestamp: datetime) -> Function:
     return func.timezone('UTC', timestamp)
 
 
+def jst_day_range(d: date) -> Tuple[datetime, datetime]:
+    '''The beginnings of a day in JST and of the next day
+
+    Comparing a timestamp column with them, instead of casting the column to a date in JST,
+    lets PostgreSQL use an index on the column.
+
+    >>> [t.isoformat() for t in jst_day_range(date(2018, 10, 3))]
+    ['2018-10-03T00:00:00+09:00', '2018-10-04T00:00:00+09:00']
+    '''
+    start = JST.localize(datetime(d.year, d.month, d.day))
+    return (start, start + timedelta(days=1))
+
+
+def jst_year_range(year: int) -> Tuple[datetime, datetime]:
+    '''
+    >>> [t.isoformat() for t in jst_year_range(2018)]
+    ['2018-01-01T00:00:00+09:00', '2019-01-01T00:00:00+09:00']
+    '''
+    return (JST.localize(datetime(year, 1, 1)), JST.localize(datetime(year + 1, 1, 1)))
+
+
 def stringify(query: Any) -> str:
 
     if type(query) == Query:
@@ -5,7 +5,9 @@ from sqlalchemy import (
     TIMESTAMP,
     Boolean,
     Column,
+    Date,
     Float,
+    Index,
     Integer,
     Numeric,
     String,
@@ -96,9 +98,33 @@ class Close(Base):
         return {'ric': self.ric, 't': self.t}
 
 
+class DailyPrice(Base):
+    '''The open, high, low, and close of the prices of a day in JST
+
+    Charts of long ranges are drawn from these rows instead of every price.
+    '''
+
+    __tablename__ = 'daily_prices'
+
+    ric = Column(String,
+                 primary_key=True,
+                 comment='Reuters Instrument Code')
+    day = Column(Date, primary_key=True, comment='Date in JST')
+    t_open = Column(TIMESTAMP(timezone=True), nullable=False)
+    open = Column(Float, nullable=False)
+    t_high = Column(TIMESTAMP(timezone=True), nullable=False)
+    high = Column(Float, nullable=False)
+    t_low = Column(TIMESTAMP(timezone=True), nullable=False)
+    low = Column(Float, nullable=False)
+    t_close = Column(TIMESTAMP(timezone=True), nullable=False)
+    close = Column(Float, nullable=False)
+
+
 class Headline(Base):
 
     __tablename__ = 'headlines'
+    # Alignments and the evaluation lists select used headlines of a phase in the order of time
+    __table_args__ = (Index('headlines_phase_is_used_t', 'phase', 'is_used', 't'),)
 
     article_id = Column(String, primary_key=True)
     t = Column(TIMESTAMP(timezone=True), nullable=False)
@@ -221,15 +247,57 @@ class GenerationResult(Base):
         self.result = result
 
 
+class PregeneratedHeadline(Base):
+
+    __tablename__ = 'pregenerated_headlines'
+
+    model_id = Column(String,
+                      primary_key=True,
+                      comment='SHA-1 of the model file and the vocab file')
+    ric = Column(String, primary_key=True)
+    t = Column(TIMESTAMP(timezone=True), primary_key=True)
+    tokens = Column(postgresql.ARRAY(String), nullable=False)
+
+    def __init__(self,
+                 model_id: str,
+                 ric: str,
+                 t: datetime,
+                 tokens: List[str]):
+
+        self.model_id = model_id
+        self.ric = ric
+        self.t = t
+        self.tokens = tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'model_id': self.model_id,
+                'ric': self.ric,
+                't': self.t,
+                'tokens': self.tokens}
+
+
 def create_tables(engine: Engine) -> None:
     Base.metadata.create_all(engine, tables=[Price.__table__,
                                              PriceSeq.__table__,
                                              Headline.__table__,
                                              Instrument.__table__,
                                              Close.__table__,
+                                             DailyPrice.__table__,
                                              HumanEvaluation.__table__,
-                                             GenerationResult.__table__])
+                                             GenerationResult.__table__,
+                                             PregeneratedHeadline.__table__])
 
 
 def create_table(engine: Engine, table: Table) -> None:
     Base.metadata.create_all(engine, tables=[table])
+
+
+def create_indexes(engine: Engine) -> None:
+    '''Add the indexes introduced after the tables of an existing database were created
+
+    The primary keys already index `prices (ric, t)`, `closes (ric, t)`, and `price_seqs (ric, seqtype, t)`.
+    '''
+    for table in [Headline.__table__]:
+        for index in table.indexes:
+            columns = ', '.join(column.name for column in index.columns)
+            engine.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(index.name, table.name, columns))
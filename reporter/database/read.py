@@ -1,18 +1,24 @@
 import itertools
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from logging import Logger
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Set, Tuple, Union
 from xml.etree.ElementTree import fromstring
 
-from sqlalchemy import Date, Integer, cast, extract, func
+from sqlalchemy import Integer, cast, extract, func
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import text
 from tqdm import tqdm
 
 from reporter.core.operation import find_operation
-from reporter.database.misc import in_jst, in_utc
-from reporter.database.model import Headline, Price, PriceSeq
-from reporter.util.constant import UTC, Code, Phase, SeqType
+from reporter.database.misc import in_jst, in_utc, jst_day_range
+from reporter.database.model import (
+    Headline,
+    PregeneratedHeadline,
+    Price,
+    PriceSeq
+)
+from reporter.util.constant import JST, UTC, Code, Phase, SeqType
 from reporter.util.conversion import stringify_ric_seqtype
 
 
@@ -60,10 +66,11 @@ def fetch_date_range(session: Session) -> Tuple[datetime, datetime]:
 def fetch_prices_of_a_day(session: Session,
                           ric: str,
                           jst: datetime) -> List[Tuple[datetime, Decimal]]:
+    (start, end) = jst_day_range(jst.date())
     results = session \
         .query(func.to_char(in_utc(Price.t), 'YYYY-MM-DD HH24:MI:SS').label('t'),
                Price.val) \
-        .filter(cast(in_jst(Price.t), Date) == jst.date(), Price.ric == ric) \
+        .filter(Price.ric == ric, Price.t >= start, Price.t < end) \
         .order_by(Price.t) \
         .all()
 
@@ -76,10 +83,11 @@ def fetch_max_t_of_prev_trading_day(session: Session, ric: str, t: datetime) ->
     assert(t.tzinfo == UTC)
 
     prev_day = t + timedelta(hours=9) - timedelta(days=1)
+    (_, end) = jst_day_range(prev_day.date())
 
     return session \
         .query(extract('epoch', func.max(Price.t))) \
-        .filter(cast(in_jst(Price.t), Date) <= prev_day.date(), Price.ric == ric) \
+        .filter(Price.ric == ric, Price.t < end) \
         .scalar()
 
 
@@ -106,6 +114,110 @@ def fetch_latest_vals(session: Session,
             [] if r is None else ['{:.2f}'.format(v) for v in r.vals])
 
 
+def fetch_latest_vals_many(session: Session,
+                           times: List[datetime],
+                           rics: List[str],
+                           seqtypes: List[SeqType]) -> List[Dict[str, List[str]]]:
+    '''Same as :func:`fetch_latest_vals` for every combination of the arguments in one query
+
+    The result has one chart per time, in the order of ``times``.
+    '''
+    if len(times) == 0:
+        return []
+
+    sql = text("""
+               SELECT times.i, latest.ric, latest.seqtype, latest.vals
+               FROM
+               (VALUES
+               """ +
+               ", ".join(["(%d, :t%d ::timestamptz)" % (i, i) for i in range(len(times))])
+               + """
+               ) AS times (i, t)
+               CROSS JOIN LATERAL
+               (SELECT DISTINCT ON (ric, seqtype) ric, seqtype, vals
+                FROM price_seqs
+                WHERE ric = ANY(:rics)
+                  AND seqtype = ANY(:seqtypes)
+                  AND t <= times.t
+                  AND t > times.t - interval '7 days'
+                ORDER BY ric, seqtype, t DESC) AS latest
+               """)
+    t_dict = {'t%d' % i: t for (i, t) in enumerate(times)}
+    result = session.execute(sql, {'rics': list(rics),
+                                   'seqtypes': [seqtype.value for seqtype in seqtypes],
+                                   **t_dict})
+
+    charts = [dict((stringify_ric_seqtype(ric, seqtype), [])
+                   for (ric, seqtype) in itertools.product(rics, seqtypes))
+              for _ in times]
+    for (i, ric, seqtype, vals) in result:
+        charts[i][stringify_ric_seqtype(ric, SeqType(seqtype))] = \
+            [] if vals is None else ['{:.2f}'.format(v) for v in vals]
+    return charts
+
+
+def fetch_slots(session: Session, rics: List[str], start: datetime, end: datetime) -> List[datetime]:
+    '''The beginnings of the 5-minute slots in [start, end) which have a price of any of ``rics``
+    '''
+    sql = text("""
+               SELECT DISTINCT to_timestamp(floor(extract(epoch FROM t) / 300) * 300) AS slot
+               FROM prices
+               WHERE ric = ANY(:rics) AND t >= :start AND t < :end
+               ORDER BY slot
+               """)
+    return [r.slot for r in session.execute(sql, {'rics': list(rics), 'start': start, 'end': end})]
+
+
+def fetch_trading_days(session: Session, rics: List[str], start: datetime, end: datetime) -> List[date]:
+    '''The days in JST in [start, end) which have a price of any of ``rics``
+    '''
+    sql = text("""
+               SELECT DISTINCT CAST(timezone('Asia/Tokyo', t) AS date) AS day
+               FROM prices
+               WHERE ric = ANY(:rics) AND t >= :start AND t < :end
+               ORDER BY day
+               """)
+    return [r.day for r in session.execute(sql, {'rics': list(rics), 'start': start, 'end': end})]
+
+
+def fetch_adjacent_trading_days(session: Session, rics: List[str], day: date) -> List[date]:
+    '''The trading days in JST before and after ``day`` which exist
+    '''
+    (start, end) = jst_day_range(day)
+    sql = text("""
+               SELECT
+               (SELECT max(t) FROM prices WHERE ric = ANY(:rics) AND t < :start) AS prev,
+               (SELECT min(t) FROM prices WHERE ric = ANY(:rics) AND t >= :end) AS next
+               """)
+    result = session.execute(sql, {'rics': list(rics), 'start': start, 'end': end}).first()
+    return [t.astimezone(JST).date() for t in result if t is not None]
+
+
+def fetch_pregenerated_slots(session: Session,
+                             model_id: str,
+                             start: datetime,
+                             end: datetime) -> Set[Tuple[str, datetime]]:
+    results = session \
+        .query(PregeneratedHeadline.ric, PregeneratedHeadline.t) \
+        .filter(PregeneratedHeadline.model_id == model_id,
+                PregeneratedHeadline.t >= start,
+                PregeneratedHeadline.t < end) \
+        .all()
+    return set((r.ric, r.t) for r in results)
+
+
+def fetch_pregenerated_headline(session: Session,
+                                model_id: str,
+                                ric: str,
+                                t: datetime) -> Union[List[str], None]:
+    return session \
+        .query(PregeneratedHeadline.tokens) \
+        .filter(PregeneratedHeadline.model_id == model_id,
+                PregeneratedHeadline.ric == ric,
+                PregeneratedHeadline.t == t) \
+        .scalar()
+
+
 def load_alignments_from_db(session: Session, phase: Phase, logger: Logger) -> List[Alignment]:
 
     headlines = session \
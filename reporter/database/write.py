@@ -11,10 +11,10 @@ import pandas
 from janome.tokenizer import Tokenizer
 from pytz import UTC
 from sqlalchemy.orm.session import Session
-from sqlalchemy.sql.expression import extract
+from sqlalchemy.sql import text
 from tqdm import tqdm
 
-from reporter.database.misc import in_jst
+from reporter.database.misc import jst_year_range
 from reporter.database.model import (
     Close,
     Headline,
@@ -247,9 +247,10 @@ def insert_headlines(session: Session,
             if 'Z' not in t or '+' not in t:
                 t = t + '+0000'
             t = datetime.strptime(t, NIKKEI_DATETIME_FORMAT).astimezone(JST)
+            (start, end) = jst_year_range(t.year)
             first = session \
                 .query(Headline) \
-                .filter(extract('year', in_jst(Headline.t)) == t.year) \
+                .filter(Headline.t >= start, Headline.t < end) \
                 .first()
             if first is not None:
                 return
@@ -362,3 +363,35 @@ def insert_instruments(session: Session, dest_ric: Path, logger: Logger) -> None
             instrument = Instrument(ric, desc, currency, type_, exchange)
             session.merge(instrument)
     session.commit()
+
+
+def insert_daily_prices(session: Session) -> None:
+    '''Aggregate the prices of each day in JST into `daily_prices`, replacing the existing rows
+    '''
+    sql = text("""
+               INSERT INTO daily_prices (ric, day, t_open, open, t_high, high, t_low, low, t_close, close)
+               SELECT DISTINCT ON (ric, day)
+                   ric,
+                   day,
+                   first_value(t) OVER w_open, first_value(val) OVER w_open,
+                   first_value(t) OVER w_high, first_value(val) OVER w_high,
+                   first_value(t) OVER w_low, first_value(val) OVER w_low,
+                   first_value(t) OVER w_close, first_value(val) OVER w_close
+               FROM
+               (SELECT ric, CAST(timezone('Asia/Tokyo', t) AS date) AS day, t, val ::float AS val
+                FROM prices
+                WHERE val IS NOT NULL) p
+               WINDOW
+                   w_open AS (PARTITION BY ric, day ORDER BY t),
+                   w_high AS (PARTITION BY ric, day ORDER BY val DESC, t),
+                   w_low AS (PARTITION BY ric, day ORDER BY val, t),
+                   w_close AS (PARTITION BY ric, day ORDER BY t DESC)
+               ORDER BY ric, day
+               ON CONFLICT (ric, day) DO UPDATE SET
+                   t_open = EXCLUDED.t_open, open = EXCLUDED.open,
+                   t_high = EXCLUDED.t_high, high = EXCLUDED.high,
+                   t_low = EXCLUDED.t_low, low = EXCLUDED.low,
+                   t_close = EXCLUDED.t_close, close = EXCLUDED.close
+               """)
+    session.execute(sql)
+    session.commit()
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import itertools
+import os
+import re
+import warnings
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import toml
+import torch
+import torch.multiprocessing
+
+from reporter.main import prepare_alignments, train
+from reporter.preprocessing.dataset import (
+    create_shared_dataset,
+    create_shared_iterators
+)
+from reporter.util.config import Config
+from reporter.util.logging import create_logger
+
+# Shared datasets received by each worker of the pool
+_group_to_dataset = dict()
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(prog='reporter.experiment')
+    parser.add_argument('--device',
+                        type=str,
+                        metavar='DEVICE',
+                        default='cpu',
+                        help='`cuda:n` where `n` is an integer, or `cpu`')
+    parser.add_argument('--debug',
+                        dest='is_debug',
+                        action='store_true',
+                        default=False,
+                        help='show detailed messages while execution')
+    configs = parser.add_mutually_exclusive_group(required=True)
+    configs.add_argument('--config',
+                         type=str,
+                         dest='dest_configs',
+                         metavar='FILENAME',
+                         nargs='+',
+                         help='train one variant per config file')
+    configs.add_argument('--grid',
+                         type=str,
+                         dest='dest_grid',
+                         metavar='FILENAME',
+                         help='train one variant per combination of values in a grid file')
+    parser.add_argument('-p',
+                        '--processes',
+                        type=int,
+                        metavar='N',
+                        default=os.cpu_count() or 1,
+                        help='the number of variants trained concurrently')
+    parser.add_argument('-o',
+                        '--output-subdir',
+                        type=str,
+                        metavar='DIRNAME')
+    return parser.parse_args()
+
+
+class Variant:
+
+    def __init__(self, name: str, config: Config):
+
+        self.name = name
+        self.config = config
+
+    @property
+    def dataset_key(self) -> Tuple[Any, ...]:
+        '''Variants with the same key can share one preprocessed dataset
+        '''
+        return (str(self.config.dir_output),
+                tuple(self.config.rics),
+                self.config.token_min_freq,
+                self.config.use_init_token_tag)
+
+
+def load_grid(dest_grid: Path) -> List[Variant]:
+    '''Expand a grid file into variants
+
+    A grid file names a base config and lists values of options as `section.key`::
+
+        base = 'config.toml'
+
+        [grid]
+        'train.learning_rate' = [1e-4, 1e-3]
+        'encoder.enc_hidden_size' = [128, 256]
+    '''
+    grid_file = toml.load(str(dest_grid))
+    base = grid_file['base']
+    grid = grid_file.get('grid', {})
+    keys = sorted(grid.keys())
+
+    variants = []
+    for vals in itertools.product(*[grid[key] for key in keys]):
+        overrides = dict()
+        for (key, val) in zip(keys, vals):
+            section, option = key.split('.', 1)
+            overrides.setdefault(section, {})[option] = val
+        name = '_'.join('{}-{}'.format(key.split('.', 1)[1], val) for (key, val) in zip(keys, vals))
+        name = re.sub(r'[^\w.=-]', '', name) or Path(base).stem
+        variants.append(Variant(name, Config(base, overrides)))
+    return variants
+
+
+def load_configs(dest_configs: List[str]) -> List[Variant]:
+    return [Variant(Path(dest_config).stem, Config(dest_config)) for dest_config in dest_configs]
+
+
+def _init_worker(group_to_dataset: Dict[Tuple[Any, ...], Any], n_threads: int) -> None:
+    global _group_to_dataset
+    _group_to_dataset = group_to_dataset
+    torch.set_num_threads(n_threads)
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+
+
+def _train_variant(job: Tuple[int, Variant, Path, argparse.Namespace]) -> Tuple[int, Dict[str, Any]]:
+
+    (i, variant, dest_dir, args) = job
+    config = variant.config
+
+    logger = create_logger(dest_dir / Path('reporter.log'),
+                           is_debug=args.is_debug,
+                           name='{}.{}'.format(__name__, variant.name))
+    config.write_log(logger)
+
+    device = torch.device(args.device)
+    (vocab, datasets) = _group_to_dataset[variant.dataset_key]
+    (train_iter, valid_iter, test_iter) = create_shared_iterators(datasets, config.batch_size, device)
+
+    train_args = argparse.Namespace(device=args.device,
+                                    is_debug=args.is_debug,
+                                    save_attention=False,
+                                    resume=False,
+                                    instrument=False,
+                                    profile_epochs=None)
+    result = train(train_args,
+                   config,
+                   dest_dir,
+                   logger,
+                   dataset=(vocab, train_iter, valid_iter, test_iter))
+
+    return (i, {'name': variant.name,
+                'config': config.filename,
+                'overrides': config.overrides,
+                'best_epoch': result.best_epoch,
+                'valid_bleu': result.valid_bleu,
+                'test_bleu': result.test_bleu})
+
+
+def main() -> None:
+
+    args = parse_args()
+
+    if not args.is_debug:
+        warnings.simplefilter(action='ignore', category=FutureWarning)
+
+    variants = load_grid(Path(args.dest_grid)) \
+        if args.dest_grid is not None \
+        else load_configs(args.dest_configs)
+
+    base_config = variants[0].config
+    now = datetime.today().strftime('experiment-%Y-%m-%d-%H-%M-%S')
+    dest_dir = base_config.dir_output / Path(now) \
+        if args.output_subdir is None \
+        else base_config.dir_output / Path(args.output_subdir)
+
+    logger = create_logger(dest_dir / Path('experiment.log'), is_debug=args.is_debug)
+    logger.info('start experiment ({} variants, {} processes)'.format(len(variants), args.processes))
+
+    # === Dataset (once per group of variants) ===
+    group_to_dataset = dict()
+    for variant in variants:
+        if variant.dataset_key in group_to_dataset:
+            continue
+        prepare_alignments(variant.config, logger)
+        logger.info('build a shared dataset for {}'.format(variant.name))
+        group_to_dataset[variant.dataset_key] = create_shared_dataset(variant.config)
+
+    # === Train ===
+    n_processes = max(1, min(args.processes, len(variants)))
+    n_threads = max(1, (os.cpu_count() or 1) // n_processes)
+    jobs = [(i, variant, dest_dir / Path(variant.name), args) for (i, variant) in enumerate(variants)]
+
+    context = torch.multiprocessing.get_context('spawn')
+    results = [None] * len(variants)
+    with context.Pool(n_processes, initializer=_init_worker, initargs=(group_to_dataset, n_threads)) as pool:
+        for (i, result) in pool.imap_unordered(_train_variant, jobs):
+            results[i] = result
+            logger.info(' | '.join(['variant: {}'.format(result['name']),
+                                    'best epoch: {:04d}'.format(result['best_epoch']),
+                                    'validation BLEU: {:.4f}'.format(result['valid_bleu']),
+                                    'test BLEU: {:.10f}'.format(result['test_bleu'])]))
+
+    # === Summary ===
+    header = ['name', 'config', 'overrides', 'best_epoch', 'valid_bleu', 'test_bleu']
+    with (dest_dir / Path('summary.csv')).open(mode='w') as w:
+        writer = csv.DictWriter(w, fieldnames=header, delimiter=',', quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(results)
+    logger.info('end experiment (summary: {})'.format(dest_dir / Path('summary.csv')))
+
+
+if __name__ == '__main__':
+    main()
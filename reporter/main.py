@@ -1,27 +1,49 @@
 import argparse
+import logging
+import random
 import warnings
 from datetime import datetime
+from logging import Logger
 from pathlib import Path
+from typing import Iterable, Tuple, Union
 
 import jsonlines
 import torch
 from sqlalchemy.engine import create_engine
 from sqlalchemy.orm.session import sessionmaker
+from torch.nn.parallel import DistributedDataParallel
+from torchtext.vocab import Vocab
 
+from reporter.core.checkpoint import (
+    CheckpointWriter,
+    capture_rng_state,
+    load_checkpoint,
+    restore_rng_state
+)
+from reporter.core.distributed import (
+    broadcast_flag,
+    cleanup_process_group,
+    setup_process_group,
+    shard
+)
 from reporter.core.network import (
+    Attention,
     Decoder,
     Encoder,
     EncoderDecoder,
     setup_attention
 )
-from reporter.core.train import run
-from reporter.database.model import create_tables
+from reporter.core.train import TrainResult, run
+from reporter.database.instrument import QueryRecorder
+from reporter.database.model import create_indexes, create_tables
 from reporter.database.read import load_alignments_from_db
+from reporter.postprocessing.attention import AttentionWriter
 from reporter.postprocessing.bleu import calc_bleu
 from reporter.postprocessing.export import export_results_to_csv
 from reporter.preprocessing.dataset import create_dataset, prepare_resources
 from reporter.util.config import Config
-from reporter.util.constant import Phase, SpecialToken
+from reporter.util.constant import GENERATION_LIMIT, SEED, Phase, SpecialToken
+from reporter.util.instrument import Instrument, parse_epoch_range
 from reporter.util.logging import create_logger
 
 
@@ -52,62 +74,98 @@ def parse_args() -> argparse.Namespace:
                         '--output-subdir',
                         type=str,
                         metavar='DIRNAME')
-    return parser.parse_args()
-
-
-def main() -> None:
-
-    args = parse_args()
-
-    if not args.is_debug:
-        warnings.simplefilter(action='ignore', category=FutureWarning)
-
-    config = Config(args.dest_config)
-
-    device = torch.device(args.device)
+    parser.add_argument('--save-attention',
+                        action='store_true',
+                        default=False,
+                        help='write attention weights of the test set to `attention-test.npy`')
+    parser.add_argument('--workers',
+                        type=int,
+                        metavar='N',
+                        default=1,
+                        help='train with N data-parallel processes (CPU only, default: 1)')
+    parser.add_argument('--resume',
+                        action='store_true',
+                        default=False,
+                        help='resume training from `reporter.checkpoint` in the directory given by `--output-subdir`')
+    parser.add_argument('--instrument',
+                        action='store_true',
+                        default=False,
+                        help='write timings, throughput and peak RSS of each epoch to `reporter.perf.jsonl`')
+    parser.add_argument('--profile-epochs',
+                        type=parse_epoch_range,
+                        metavar='START[:END]',
+                        help='with `--instrument`, save `torch` profiler traces of the epochs in [START, END)')
+    args = parser.parse_args()
 
-    now = datetime.today().strftime('reporter-%Y-%m-%d-%H-%M-%S')
-    dest_dir = config.dir_output / Path(now) \
-        if args.output_subdir is None \
-        else config.dir_output / Path(args.output_subdir)
+    if args.workers < 1:
+        parser.error('--workers must be a positive integer')
+    if args.workers > 1 and torch.device(args.device).type != 'cpu':
+        parser.error('--workers is supported only with `--device cpu`')
+    if args.resume and args.output_subdir is None:
+        parser.error('--resume requires --output-subdir')
 
-    dest_log = dest_dir / Path('reporter.log')
+    return args
 
-    logger = create_logger(dest_log, is_debug=args.is_debug)
-    config.write_log(logger)
 
-    message = 'start main (is_debug: {}, device: {})'.format(args.is_debug, args.device)
-    logger.info(message)
+def prepare_alignments(config: Config, logger: Logger) -> None:
 
-    # === Alignment ===
     has_all_alignments = \
         all([(config.dir_output / Path('alignment-{}.json'.format(phase.value))).exists()
              for phase in list(Phase)])
 
-    if not has_all_alignments:
+    if has_all_alignments:
+        return
 
-        engine = create_engine(config.db_uri)
-        SessionMaker = sessionmaker(bind=engine)
-        pg_session = SessionMaker()
-        create_tables(engine)
+    engine = create_engine(config.db_uri)
+    recorder = QueryRecorder(logger, config.query_warn_threshold).attach(engine)
+    SessionMaker = sessionmaker(bind=engine)
+    pg_session = SessionMaker()
+    create_tables(engine)
+    create_indexes(engine)
 
+    with recorder.unit('resources') as stats:
         prepare_resources(config, pg_session, logger)
-        for phase in list(Phase):
-            config.dir_output.mkdir(parents=True, exist_ok=True)
-            dest_alignments = config.dir_output / Path('alignment-{}.json'.format(phase.value))
+    logger.info(stats.summary())
+    for phase in list(Phase):
+        config.dir_output.mkdir(parents=True, exist_ok=True)
+        dest_alignments = config.dir_output / Path('alignment-{}.json'.format(phase.value))
+        with recorder.unit('alignment-{}'.format(phase.value)) as stats:
             alignments = load_alignments_from_db(pg_session, phase, logger)
-            with dest_alignments.open(mode='w') as f:
-                writer = jsonlines.Writer(f)
-                writer.write_all(alignments)
-        pg_session.close()
+        logger.info(stats.summary())
+        with dest_alignments.open(mode='w') as f:
+            writer = jsonlines.Writer(f)
+            writer.write_all(alignments)
+    pg_session.close()
+
+
+def train(args: argparse.Namespace,
+          config: Config,
+          dest_dir: Path,
+          logger: Logger,
+          rank: int = 0,
+          world_size: int = 1,
+          dataset: Union[Tuple[Vocab, Iterable, Iterable, Iterable], None] = None,
+          instrument: Union[Instrument, None] = None) -> Union[TrainResult, None]:
+
+    device = torch.device(args.device)
+    is_main_process = rank == 0
+    instrument = Instrument(None) if instrument is None else instrument
+
+    # Every worker must build the same parameters and shuffle batches in the same order
+    random.seed(SEED)
+    torch.manual_seed(SEED)
 
     # === Dataset ===
-    (vocab, train, valid, test) = create_dataset(config, device)
+    with instrument.record(stage='dataset'):
+        (vocab, train, valid, test) = create_dataset(config, device) \
+            if dataset is None \
+            else dataset
 
     vocab_size = len(vocab)
-    dest_vocab = dest_dir / Path('reporter.vocab')
-    with dest_vocab.open(mode='wb') as f:
-        torch.save(vocab, f)
+    if is_main_process:
+        dest_vocab = dest_dir / Path('reporter.vocab')
+        with dest_vocab.open(mode='wb') as f:
+            torch.save(vocab, f)
     seqtypes = []
     attn = setup_attention(config, seqtypes)
     encoder = Encoder(config, device)
@@ -119,60 +177,136 @@ def main() -> None:
 
     # === Train ===
     dest_model = dest_dir / Path('reporter.model')
+    dest_checkpoint = dest_dir / Path('reporter.checkpoint')
+    checkpoint_writer = CheckpointWriter() if is_main_process else None
+    start_epoch = 0
     prev_valid_bleu = 0.0
     max_bleu = 0.0
     best_epoch = 0
     early_stop_counter = 0
-    for epoch in range(config.n_epochs):
-        logger.info('start epoch {}'.format(epoch))
-        train_result = run(train,
-                           vocab,
-                           model,
-                           optimizer,
-                           criterion,
-                           Phase.Train,
-                           logger)
-        train_bleu = calc_bleu(train_result.gold_sents, train_result.pred_sents)
-        valid_result = run(valid,
-                           vocab,
-                           model,
-                           optimizer,
-                           criterion,
-                           Phase.Valid,
-                           logger)
-        valid_bleu = calc_bleu(valid_result.gold_sents, valid_result.pred_sents)
-
-        s = ' | '.join(['epoch: {0:4d}'.format(epoch),
-                        'training loss: {:.2f}'.format(train_result.loss),
-                        'training BLEU: {:.4f}'.format(train_bleu),
-                        'validation loss: {:.2f}'.format(valid_result.loss),
-                        'validation BLEU: {:.4f}'.format(valid_bleu)])
-        logger.info(s)
-
-        if max_bleu < valid_bleu:
-            torch.save(model.state_dict(), str(dest_model))
-            max_bleu = valid_bleu
-            best_epoch = epoch
-
-        early_stop_counter = early_stop_counter + 1 \
-            if prev_valid_bleu > valid_bleu \
-            else 0
-        if early_stop_counter == config.patience:
-            logger.info('EARLY STOPPING')
+
+    if args.resume:
+        checkpoint = load_checkpoint(dest_checkpoint, device)
+        model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        train.load_state_dict(checkpoint['train_iterator'])
+        restore_rng_state(checkpoint['rng'])
+        prev_valid_bleu = checkpoint['prev_valid_bleu']
+        max_bleu = checkpoint['max_bleu']
+        best_epoch = checkpoint['best_epoch']
+        early_stop_counter = checkpoint['early_stop_counter']
+        start_epoch = config.n_epochs \
+            if checkpoint['is_early_stopped'] \
+            else checkpoint['epoch'] + 1
+        logger.info('resume from {} (epoch: {})'.format(dest_checkpoint, checkpoint['epoch']))
+
+    # Gradients are all-reduced through the wrapper,
+    # while evaluation runs on the bare model of the main process only
+    train_model = DistributedDataParallel(model, broadcast_buffers=False) \
+        if world_size > 1 \
+        else model
+
+    for epoch in range(start_epoch, config.n_epochs):
+        with instrument.record(epoch=epoch):
+            logger.info('start epoch {}'.format(epoch))
+            with instrument.phase(Phase.Train.value):
+                train_result = run(shard(train, rank, world_size),
+                                   vocab,
+                                   train_model,
+                                   optimizer,
+                                   criterion,
+                                   Phase.Train,
+                                   logger,
+                                   instrument=instrument)
+
+            should_stop = False
+            if is_main_process:
+                with instrument.phase('bleu'):
+                    train_bleu = calc_bleu(train_result.gold_sents, train_result.pred_sents)
+                with instrument.phase(Phase.Valid.value):
+                    valid_result = run(valid,
+                                       vocab,
+                                       model,
+                                       optimizer,
+                                       criterion,
+                                       Phase.Valid,
+                                       logger,
+                                       instrument=instrument)
+                with instrument.phase('bleu'):
+                    valid_bleu = calc_bleu(valid_result.gold_sents, valid_result.pred_sents)
+
+                with instrument.phase('logging'):
+                    s = ' | '.join(['epoch: {0:4d}'.format(epoch),
+                                    'training loss: {:.2f}'.format(train_result.loss),
+                                    'training BLEU: {:.4f}'.format(train_bleu),
+                                    'validation loss: {:.2f}'.format(valid_result.loss),
+                                    'validation BLEU: {:.4f}'.format(valid_bleu)])
+                    logger.info(s)
+
+                with instrument.phase('checkpoint'):
+                    if max_bleu < valid_bleu:
+                        checkpoint_writer.save(dest_model, model.state_dict())
+                        max_bleu = valid_bleu
+                        best_epoch = epoch
+
+                early_stop_counter = early_stop_counter + 1 \
+                    if prev_valid_bleu > valid_bleu \
+                    else 0
+                if early_stop_counter == config.patience:
+                    logger.info('EARLY STOPPING')
+                    should_stop = True
+                prev_valid_bleu = valid_bleu
+
+                # `checkpoint_interval = 0` saves a checkpoint only when the training stops early
+                is_periodic = config.checkpoint_interval > 0 and (epoch + 1) % config.checkpoint_interval == 0
+                if should_stop or is_periodic:
+                    with instrument.phase('checkpoint'):
+                        checkpoint = {'epoch': epoch,
+                                      'model': model.state_dict(),
+                                      'optimizer': optimizer.state_dict(),
+                                      'train_iterator': train.state_dict(),
+                                      'rng': capture_rng_state(),
+                                      'prev_valid_bleu': prev_valid_bleu,
+                                      'max_bleu': max_bleu,
+                                      'best_epoch': best_epoch,
+                                      'early_stop_counter': early_stop_counter,
+                                      'is_early_stopped': should_stop}
+                        checkpoint_writer.save(dest_checkpoint, checkpoint)
+
+        if world_size > 1:
+            should_stop = broadcast_flag(should_stop)
+        if should_stop:
             break
-        prev_valid_bleu = valid_bleu
+
+    if not is_main_process:
+        return None
+
+    checkpoint_writer.close()
 
     # === Test ===
     with dest_model.open(mode='rb') as f:
         model.load_state_dict(torch.load(f))
-    test_result = run(test,
-                      vocab,
-                      model,
-                      optimizer,
-                      criterion,
-                      Phase.Test,
-                      logger)
-    test_bleu = calc_bleu(test_result.gold_sents, test_result.pred_sents)
+    attn_writer = AttentionWriter(dest_dir / Path('attention-test.npy'),
+                                  n_articles=len(test.dataset),
+                                  n_steps=GENERATION_LIMIT - 1,
+                                  n_rics=len(encoder.extra_rics)) \
+        if args.save_attention and isinstance(attn, Attention) \
+        else None
+    with instrument.record(stage=Phase.Test.value):
+        with instrument.phase(Phase.Test.value):
+            test_result = run(test,
+                              vocab,
+                              model,
+                              optimizer,
+                              criterion,
+                              Phase.Test,
+                              logger,
+                              attn_writer=attn_writer,
+                              instrument=instrument)
+        if attn_writer is not None:
+            attn_writer.close()
+        with instrument.phase('bleu'):
+            test_bleu = calc_bleu(test_result.gold_sents, test_result.pred_sents)
 
     s = ' | '.join(['epoch: {:04d}'.format(best_epoch),
                     'Test Loss: {:.2f}'.format(test_result.loss),
@@ -181,6 +315,83 @@ def main() -> None:
 
     export_results_to_csv(dest_dir, test_result)
 
+    return TrainResult(best_epoch, max_bleu, test_bleu)
+
+
+def create_instrument(args: argparse.Namespace, dest_dir: Path, mode: str = 'w') -> Instrument:
+    return Instrument(dest_dir / Path('reporter.perf.jsonl'), mode=mode, profile_epochs=args.profile_epochs) \
+        if args.instrument \
+        else Instrument(None)
+
+
+def train_distributed(rank: int, args: argparse.Namespace, config: Config, dest_dir: Path) -> None:
+
+    if not args.is_debug:
+        warnings.simplefilter(action='ignore', category=FutureWarning)
+
+    # Only the main process writes to `reporter.log`; the others stay quiet
+    if rank == 0:
+        logger = create_logger(dest_dir / Path('reporter.log'), is_debug=args.is_debug, mode='a')
+    else:
+        logger = logging.getLogger('{}.rank{}'.format(__name__, rank))
+        logger.propagate = False
+
+    # Workers run the same steps, so timings of the main process stand for all of them
+    instrument = create_instrument(args, dest_dir, mode='a') \
+        if rank == 0 \
+        else Instrument(None)
+
+    setup_process_group(rank, args.workers)
+    try:
+        train(args, config, dest_dir, logger, rank=rank, world_size=args.workers, instrument=instrument)
+    finally:
+        instrument.close()
+        cleanup_process_group()
+
+
+def main() -> None:
+
+    args = parse_args()
+
+    if not args.is_debug:
+        warnings.simplefilter(action='ignore', category=FutureWarning)
+
+    config = Config(args.dest_config)
+
+    now = datetime.today().strftime('reporter-%Y-%m-%d-%H-%M-%S')
+    dest_dir = config.dir_output / Path(now) \
+        if args.output_subdir is None \
+        else config.dir_output / Path(args.output_subdir)
+
+    dest_log = dest_dir / Path('reporter.log')
+
+    logger = create_logger(dest_log, is_debug=args.is_debug, mode='a' if args.resume else 'w')
+    config.write_log(logger)
+
+    message = 'start main (is_debug: {}, device: {}, workers: {})'.format(args.is_debug,
+                                                                          args.device,
+                                                                          args.workers)
+    logger.info(message)
+
+    instrument = create_instrument(args, dest_dir, mode='a' if args.resume else 'w')
+
+    # === Alignment ===
+    with instrument.record(stage='alignment'):
+        with instrument.phase('alignment'):
+            prepare_alignments(config, logger)
+
+    if args.workers > 1:
+        # Spawned workers reopen the file to append their own records
+        instrument.close()
+        torch.multiprocessing.spawn(train_distributed,
+                                    args=(args, config, dest_dir),
+                                    nprocs=args.workers)
+    else:
+        try:
+            train(args, config, dest_dir, logger, instrument=instrument)
+        finally:
+            instrument.close()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,60 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import numpy
+import torch
+from numpy.lib.format import open_memmap
+
+
+class AttentionWriter:
+    '''Stream attention weights of each article into a memory-mapped ``.npy`` file
+
+    The array has the shape ``(n_articles, n_steps, n_rics)``.
+    Rows are filled in the order articles are written,
+    and ``<dest>.index.json`` maps each article ID to its row.
+    Every decoding step is stored, including the steps after the end of a decoded sentence,
+    so readers cut each row at the end-of-sentence token of the exported headline.
+    '''
+
+    def __init__(self, dest: Path, n_articles: int, n_steps: int, n_rics: int):
+
+        self.dest = dest
+        self.dest_index = dest.with_suffix('.index.json')
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+        self.weights = open_memmap(str(self.dest),
+                                   mode='w+',
+                                   dtype=numpy.float32,
+                                   shape=(n_articles, n_steps, n_rics))
+        self.article_ids = []
+
+    def write(self,
+              article_ids: List[str],
+              attn_weight: List[Union[numpy.ndarray, torch.Tensor]]) -> None:
+
+        if len(attn_weight) == 0:
+            return
+
+        # (n_steps, batch_size, n_rics) -> (batch_size, n_steps, n_rics)
+        steps = [w.detach().cpu().numpy() if isinstance(w, torch.Tensor) else numpy.asarray(w)
+                 for w in attn_weight]
+        block = numpy.stack([s.reshape(len(article_ids), -1) for s in steps], axis=1)
+
+        i = len(self.article_ids)
+        n_articles, n_steps, n_rics = block.shape
+        self.weights[i:i + n_articles, :n_steps, :n_rics] = block
+        self.article_ids.extend(article_ids)
+
+    def close(self) -> None:
+        self.weights.flush()
+        del self.weights
+        with self.dest_index.open(mode='w') as f:
+            json.dump(dict([(article_id, i) for (i, article_id) in enumerate(self.article_ids)]), f)
+
+
+def load_attention(dest: Path) -> Tuple[Dict[str, int], numpy.ndarray]:
+    '''Open weights written by :class:`AttentionWriter` without reading them into memory
+    '''
+    with dest.with_suffix('.index.json').open(mode='r') as f:
+        article_id_to_row = json.load(f)
+    return (article_id_to_row, numpy.load(str(dest), mmap_mode='r'))
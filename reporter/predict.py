@@ -1,18 +1,20 @@
 import argparse
 import errno
+import hashlib
 import itertools
 import os
+import sys
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, Generator, Iterable, List, Tuple, Union
 
 import jsonlines
 import torch
 from sqlalchemy.engine import create_engine
 from sqlalchemy.orm.session import Session, sessionmaker
-from torchtext.data import Field, Iterator, RawField, TabularDataset
-from torchtext.vocab import Vocab
+from torchtext.data import RawField
 
+from reporter.core.checkpoint import export_flat_weights, map_flat_weights
 from reporter.core.network import (
     Decoder,
     Encoder,
@@ -23,12 +25,11 @@ from reporter.core.operation import (
     get_latest_closing_vals,
     replace_tags_with_vals
 )
-from reporter.database.read import Alignment, fetch_latest_vals
+from reporter.database.read import Alignment, fetch_latest_vals_many
 from reporter.postprocessing.text import remove_bos
+from reporter.preprocessing.dataset import TensorBatch, create_fields
 from reporter.util.config import Config
 from reporter.util.constant import (
-    N_LONG_TERM,
-    N_SHORT_TERM,
     NIKKEI_DATETIME_FORMAT,
     Code,
     Phase,
@@ -65,6 +66,16 @@ def parse_args() -> argparse.Namespace:
                         '--ric',
                         type=str,
                         help='Reuters Instrument Code (e.g. `.N225`: Nikkei Stock Average)')
+    parser.add_argument('-i',
+                        '--input',
+                        type=str,
+                        metavar='FILENAME',
+                        help='predict for each line of `TIME` or `TIME<TAB>RIC` in a file (`-`: stdin), '
+                             'and write JSON lines to stdout')
+    parser.add_argument('--batch-size',
+                        type=int,
+                        metavar='N',
+                        help='the number of lines predicted at once with `--input` (default: `batch_size` of config)')
 
     return parser.parse_args()
 
@@ -81,6 +92,8 @@ class Predictor:
 
         dest_train_vocab = output / Path('reporter.vocab')
 
+        self.model_files = [dest_pretrained_model, dest_train_vocab]
+
         if not dest_pretrained_model.is_file():
             raise FileNotFoundError(errno.ENOENT,
                                     os.strerror(errno.ENOENT),
@@ -111,35 +124,63 @@ class Predictor:
 
         with dest_pretrained_model.open(mode='rb') as f:
             self.model.load_state_dict(torch.load(f, map_location=self.device))
+        self.model.eval()
 
-    def predict(self, t: str, target_ric: str) -> List[str]:
-        # Connect to Postgres
-        engine = create_engine(self.config.db_uri)
-        SessionMaker = sessionmaker(bind=engine)
-        pg_session = SessionMaker()
-
-        rics = self.config.rics \
-            if target_ric in self.config.rics \
-            else [target_ric] + self.config.rics
-
-        alignments = load_alignments_from_db(pg_session, rics, t, self.seqtypes)
-
-        # Write the prediction data
-        self.config.dir_output.mkdir(parents=True, exist_ok=True)
-        dest_alignments = self.config.dir_output / Path('alignment-predict.json')
-        with dest_alignments.open(mode='w') as f:
-            writer = jsonlines.Writer(f)
-            writer.write(alignments.to_dict())
-
-        predict_iter = create_dataset(self.config,
-                                      self.device,
-                                      self.vocab,
-                                      rics,
-                                      self.seqtypes)
+        if self.config.mmap_weights and self.device.type == 'cpu':
+            # Processes serving the same model share the pages of the mapped file
+            dest_flat = output / Path('reporter.model.flat')
+            if not dest_flat.is_file() or dest_flat.stat().st_mtime < dest_pretrained_model.stat().st_mtime:
+                export_flat_weights(self.model.state_dict(), dest_flat)
+            map_flat_weights(self.model, dest_flat)
 
-        self.model.eval()
+        # The encoder reads `config.rics`, and the tags in a headline are filled with Nikkei 225
+        self.rics = self.config.rics \
+            if Code.N225.value in self.config.rics \
+            else [Code.N225.value] + self.config.rics
+        self.fields = create_fields(self.config, self.rics)
+        (_, token_field) = self.fields['processed_tokens']
+        token_field.vocab = self.vocab
+
+        self.model_id = hash_files(self.model_files)
 
-        batch = next(iter(predict_iter))
+        self.engine = create_engine(self.config.db_uri)
+        self.SessionMaker = sessionmaker(bind=self.engine)
+
+    def predict(self, t: str, target_ric: str) -> List[str]:
+        return self.predict_many([(t, target_ric)])[0]
+
+    def predict_many(self,
+                     queries: List[Tuple[str, str]],
+                     batch_size: Union[int, None] = None) -> List[List[str]]:
+        return list(self.iter_predict_many(queries, batch_size))
+
+    def iter_predict_many(self,
+                          queries: Iterable[Tuple[str, str]],
+                          batch_size: Union[int, None] = None) -> Generator[List[str], None, None]:
+        '''Generate a headline for each `(time, ric)` in the order of ``queries``
+
+        Each chunk of ``batch_size`` queries (default: ``config.batch_size``) is aligned
+        with one query to the database and decoded as one mini-batch.
+        '''
+        batch_size = self.config.batch_size \
+            if batch_size is None \
+            else batch_size
+        queries = iter(queries)
+        while True:
+            chunk = list(itertools.islice(queries, batch_size))
+            if len(chunk) == 0:
+                return
+            yield from self._predict_batch([t for (t, _) in chunk])
+
+    def _predict_batch(self, ts: List[str]) -> List[List[str]]:
+
+        session = self.SessionMaker()
+        try:
+            alignments = load_alignments_many(session, self.rics, ts, self.seqtypes)
+        finally:
+            session.close()
+
+        batch = create_batch(self.fields, [alignment.to_dict() for alignment in alignments], self.device)
 
         times = batch.time
         tokens = batch.token
@@ -148,79 +189,69 @@ class Predictor:
         raw_long_field = stringify_ric_seqtype(Code.N225.value, SeqType.RawLong)
         latest_closing_vals = get_latest_closing_vals(batch, raw_long_field, times)
 
-        loss, pred, attn_weight = self.model(batch,
-                                             batch.batch_size,
-                                             tokens,
-                                             times,
-                                             self.criterion,
-                                             Phase.Test)
+        with torch.no_grad():
+            loss, pred, attn_weight = self.model(batch,
+                                                 batch.batch_size,
+                                                 tokens,
+                                                 times,
+                                                 self.criterion,
+                                                 Phase.Test)
 
         i_eos = self.vocab.stoi[SpecialToken.EOS.value]
         pred_sents = [remove_bos([self.vocab.itos[i] for i in takeuntil(i_eos, sent)])
                       for sent in zip(*pred)]
 
-        return replace_tags_with_vals(pred_sents[0], latest_closing_vals[0], latest_vals[0])
+        return [replace_tags_with_vals(pred_sent, latest_closing_val, latest_val)
+                for (pred_sent, latest_closing_val, latest_val)
+                in zip(pred_sents, latest_closing_vals, latest_vals)]
 
 
-def load_alignments_from_db(session: Session,
-                            rics: List[str],
-                            t: str,
-                            seqtypes: List[SeqType]) -> Alignment:
-    time = datetime.strptime(t, NIKKEI_DATETIME_FORMAT)
-    chart = dict([fetch_latest_vals(session, time, ric, seqtype)
-                  for (ric, seqtype) in itertools.product(rics, seqtypes)])
-    processed_tokens = ['']
-    article_id = 'dummy'
-    return Alignment(article_id, t, time.hour, processed_tokens, chart)
-
-
-def create_dataset(config: Config,
-                   device: torch.device,
-                   vocab: Vocab,
-                   rics: List[str],
-                   seqtypes: List[SeqType]) -> Iterator:
-
-    fields = dict()
-    fields[SeqType.ArticleID.value] = (SeqType.ArticleID.value, RawField())
+def hash_files(paths: List[Path]) -> str:
+    h = hashlib.sha1()
+    for path in paths:
+        with path.open(mode='rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
 
-    time_field = Field(use_vocab=False, batch_first=True, sequential=False)
-    fields['jst_hour'] = (SeqType.Time.value, time_field)
 
-    token_field = \
-        Field(use_vocab=True,
-              init_token=SpecialToken.BOS.value,
-              eos_token=SpecialToken.EOS.value,
-              pad_token=SpecialToken.Padding.value,
-              unk_token=SpecialToken.Unknown.value)
-
-    fields['processed_tokens'] = (SeqType.Token.value, token_field)
+def load_alignments_many(session: Session,
+                         rics: List[str],
+                         ts: List[str],
+                         seqtypes: List[SeqType]) -> List[Alignment]:
+    times = [datetime.strptime(t, NIKKEI_DATETIME_FORMAT) for t in ts]
+    charts = fetch_latest_vals_many(session, times, rics, seqtypes)
+    processed_tokens = ['']
+    article_id = 'dummy'
+    return [Alignment(article_id, t, time.hour, processed_tokens, chart)
+            for (t, time, chart) in zip(ts, times, charts)]
 
-    tensor_type = torch.FloatTensor if device.type == 'cpu' else torch.cuda.FloatTensor
 
-    for (ric, seqtype) in itertools.product(rics, seqtypes):
-        n = N_LONG_TERM if seqtype.value.endswith('long') else N_SHORT_TERM
-        price_field = Field(use_vocab=False,
-                            fix_length=n,
-                            batch_first=True,
-                            pad_token=0.0,
-                            preprocessing=lambda xs: [float(x) for x in xs],
-                            tensor_type=tensor_type)
-        key = stringify_ric_seqtype(ric, seqtype)
-        fields[key] = (key, price_field)
+def read_queries(lines: Iterable[str], default_ric: str) -> Generator[Tuple[str, str], None, None]:
+    '''Parse lines of `TIME` or `TIME<TAB>RIC`, skipping blank lines
 
-    # load an alignment for predicttion
-    predict = TabularDataset(path='output/alignment-predict.json',
-                             format='json',
-                             fields=fields)
+    >>> list(read_queries(['2018-01-04 09:00:00+0900\\t.N225', '', '2018-01-04 09:05:00+0900'], '.TOPX'))
+    [('2018-01-04 09:00:00+0900', '.N225'), ('2018-01-04 09:05:00+0900', '.TOPX')]
+    '''
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.strip() == '':
+            continue
+        fields = line.split('\t')
+        yield (fields[0].strip(), fields[1].strip() if len(fields) > 1 else default_ric)
 
-    token_field.vocab = vocab
 
-    # Make an iteroter for prediction
-    return Iterator(predict,
-                    batch_size=1,
-                    device=-1 if device.type == 'cpu' else device,
-                    repeat=False,
-                    sort=False)
+def create_batch(fields: Dict[str, Tuple[str, RawField]],
+                 examples: List[Dict[str, Any]],
+                 device: torch.device) -> TensorBatch:
+    '''Numericalize alignments in memory, as :class:`torchtext.data.Iterator` does
+    for a :class:`torchtext.data.TabularDataset` read from JSON lines
+    '''
+    vals = dict()
+    for (key, (name, field)) in fields.items():
+        xs = [field.preprocess(example[key]) for example in examples]
+        vals[name] = field.process(xs, device=device)
+    return TensorBatch(len(examples), vals)
 
 
 def main() -> None:
@@ -231,9 +262,19 @@ def main() -> None:
                           torch.device(args.device),
                           Path(args.output))
 
-    sentence = predictor.predict(args.time, args.ric)
-
-    print('"' + '", "'.join(sentence) + '"')
+    if args.input is None:
+        sentence = predictor.predict(args.time, args.ric)
+        print('"' + '", "'.join(sentence) + '"')
+        return
+
+    default_ric = Code.N225.value \
+        if args.ric is None \
+        else args.ric
+    with (sys.stdin if args.input == '-' else open(args.input)) as f:
+        queries = list(read_queries(f, default_ric))
+    writer = jsonlines.Writer(sys.stdout, flush=True)
+    for ((t, ric), sentence) in zip(queries, predictor.iter_predict_many(queries, args.batch_size)):
+        writer.write({'time': t, 'ric': ric, 'headline': sentence})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+import argparse
+import os
+import warnings
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+import torch
+import torch.multiprocessing
+
+from reporter.database.model import PregeneratedHeadline, create_table
+from reporter.database.read import (
+    fetch_date_range,
+    fetch_pregenerated_slots,
+    fetch_slots
+)
+from reporter.predict import Predictor
+from reporter.util.config import Config
+from reporter.util.constant import JST, NIKKEI_DATETIME_FORMAT
+from reporter.util.logging import create_logger
+
+# The predictor loaded once by each worker of the pool
+_predictor = None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='reporter.pregenerate')
+    parser.add_argument('--device',
+                        type=str,
+                        metavar='DEVICE',
+                        default='cpu',
+                        help='`cuda:n` where `n` is an integer, or `cpu`')
+    parser.add_argument('--config',
+                        type=str,
+                        dest='dest_config',
+                        metavar='FILENAME',
+                        default='config.toml',
+                        help='specify config file (default: `config.toml`)')
+    parser.add_argument('-o',
+                        '--output',
+                        type=str,
+                        metavar='DIRECTORYNAME',
+                        required=True,
+                        help='specify directory of the model file and the vocab file')
+    parser.add_argument('--start',
+                        type=str,
+                        metavar='YYYY-MM-DD',
+                        help='the first day in JST (default: the first day of prices)')
+    parser.add_argument('--end',
+                        type=str,
+                        metavar='YYYY-MM-DD',
+                        help='the last day in JST (default: the last day of prices)')
+    parser.add_argument('-r',
+                        '--rics',
+                        type=str,
+                        nargs='+',
+                        metavar='RIC',
+                        help='RICs to store headlines for (default: `rics` of config)')
+    parser.add_argument('-p',
+                        '--processes',
+                        type=int,
+                        metavar='N',
+                        default=os.cpu_count() or 1,
+                        help='the number of days generated concurrently')
+    parser.add_argument('--batch-size',
+                        type=int,
+                        metavar='N',
+                        help='the number of slots predicted at once (default: `batch_size` of config)')
+    parser.add_argument('--debug',
+                        dest='is_debug',
+                        action='store_true',
+                        default=False,
+                        help='show detailed messages while execution')
+    return parser.parse_args()
+
+
+def list_days(start: date, end: date) -> List[date]:
+    '''
+    >>> list_days(date(2018, 10, 1), date(2018, 10, 3))
+    [datetime.date(2018, 10, 1), datetime.date(2018, 10, 2), datetime.date(2018, 10, 3)]
+    '''
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _init_worker(config: Config, device: str, output: Path, n_threads: int) -> None:
+    global _predictor
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+    torch.set_num_threads(n_threads)
+    _predictor = Predictor(config, torch.device(device), output)
+
+
+def _pregenerate_day(job: Tuple[date, List[str], int]) -> Tuple[date, int]:
+    '''Store headlines of the slots of a day in JST which are not stored yet
+
+    A day is committed at once, so a rerun of an interrupted job only generates the unfinished days.
+    '''
+    (day, rics, batch_size) = job
+
+    start = JST.localize(datetime(day.year, day.month, day.day))
+    end = start + timedelta(days=1)
+
+    session = _predictor.SessionMaker()
+    try:
+        done = fetch_pregenerated_slots(session, _predictor.model_id, start, end)
+        slots = [slot.astimezone(JST) for slot in fetch_slots(session, rics, start, end)]
+        slots = [slot for slot in slots if any((ric, slot) not in done for ric in rics)]
+        if len(slots) == 0:
+            return (day, 0)
+
+        # Headlines do not depend on the RIC, so a slot is predicted once for all the RICs
+        queries = [(slot.strftime(NIKKEI_DATETIME_FORMAT), rics[0]) for slot in slots]
+        rows = []
+        for (slot, sentence) in zip(slots, _predictor.iter_predict_many(queries, batch_size)):
+            rows.extend(PregeneratedHeadline(_predictor.model_id, ric, slot, sentence).to_dict()
+                        for ric in rics
+                        if (ric, slot) not in done)
+
+        session.execute(PregeneratedHeadline.__table__.insert(), rows)
+        session.commit()
+        return (day, len(rows))
+    finally:
+        session.close()
+
+
+def main() -> None:
+
+    args = parse_args()
+
+    if not args.is_debug:
+        warnings.simplefilter(action='ignore', category=FutureWarning)
+
+    config = Config(args.dest_config)
+    output = Path(args.output)
+    logger = create_logger(config.dir_logs / Path('pregenerate.log'), is_debug=args.is_debug, mode='a')
+
+    predictor = Predictor(config, torch.device(args.device), output)
+    create_table(predictor.engine, PregeneratedHeadline.__table__)
+
+    session = predictor.SessionMaker()
+    (min_t, max_t) = fetch_date_range(session)
+    session.close()
+    start = min_t.astimezone(JST).date() \
+        if args.start is None \
+        else datetime.strptime(args.start, '%Y-%m-%d').date()
+    end = max_t.astimezone(JST).date() \
+        if args.end is None \
+        else datetime.strptime(args.end, '%Y-%m-%d').date()
+    rics = config.rics \
+        if args.rics is None \
+        else args.rics
+
+    days = list_days(start, end)
+    logger.info('start pregenerating (model: {}, days: {} - {}, rics: {})'.format(predictor.model_id,
+                                                                                  start,
+                                                                                  end,
+                                                                                  rics))
+    del predictor
+
+    n_processes = max(1, min(args.processes, len(days)))
+    n_threads = max(1, (os.cpu_count() or 1) // n_processes)
+    jobs = [(day, rics, args.batch_size) for day in days]
+
+    n_rows = 0
+    context = torch.multiprocessing.get_context('spawn')
+    with context.Pool(n_processes,
+                      initializer=_init_worker,
+                      initargs=(config, args.device, output, n_threads)) as pool:
+        for (day, n) in pool.imap_unordered(_pregenerate_day, jobs):
+            n_rows += n
+            logger.info('{} | {} headlines stored'.format(day, n))
+
+    logger.info('end pregenerating ({} headlines stored)'.format(n_rows))
+
+
+if __name__ == '__main__':
+    main()
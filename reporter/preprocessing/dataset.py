@@ -1,12 +1,14 @@
 import itertools
+import math
+import random
 from logging import Logger
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Generator, List, Tuple, Union
 
 import boto3
 import torch
 from sqlalchemy.orm.session import Session
-from torchtext.data import Field, Iterator, RawField, TabularDataset
+from torchtext.data import Dataset, Field, Iterator, RawField, TabularDataset
 from torchtext.vocab import Vocab
 
 from reporter.database.read import Alignment, are_headlines_ready, fetch_rics
@@ -26,6 +28,7 @@ from reporter.util.config import Config
 from reporter.util.constant import (
     N_LONG_TERM,
     N_SHORT_TERM,
+    SEED,
     Phase,
     SeqType,
     SpecialToken
@@ -88,7 +91,7 @@ def prepare_resources(config: Config, db_session: Session, logger: Logger) -> Di
     update_headlines(db_session, config.dir_resources / Path('user-dict.csv'), logger)
 
 
-def create_dataset(config: Config, device: torch.device) -> Tuple[Vocab, Iterator, Iterator, Iterator]:
+def create_fields(config: Config, rics: Union[List[str], None] = None) -> Dict[str, Tuple[str, Field]]:
 
     fields = dict()
     raw_field = RawField()
@@ -119,7 +122,7 @@ def create_dataset(config: Config, device: torch.device) -> Tuple[Vocab, Iterato
                 SeqType.NormMovRefShort, SeqType.NormMovRefLong,
                 SeqType.StdShort, SeqType.StdLong]
 
-    for (ric, seqtype) in itertools.product(config.rics, seqtypes):
+    for (ric, seqtype) in itertools.product(config.rics if rics is None else rics, seqtypes):
         n = N_LONG_TERM \
             if seqtype.value.endswith('long') \
             else N_SHORT_TERM
@@ -132,6 +135,11 @@ def create_dataset(config: Config, device: torch.device) -> Tuple[Vocab, Iterato
         key = stringify_ric_seqtype(ric, seqtype)
         fields[key] = (key, price_field)
 
+    return fields
+
+
+def load_splits(config: Config, fields: Dict[str, Tuple[str, Field]]) -> Tuple[Vocab, Dataset, Dataset, Dataset]:
+
     train, val, test = \
         TabularDataset.splits(path=str(config.dir_output),
                               format='json',
@@ -140,8 +148,17 @@ def create_dataset(config: Config, device: torch.device) -> Tuple[Vocab, Iterato
                               test='alignment-test.json',
                               fields=fields)
 
+    (_, token_field) = fields['processed_tokens']
     token_field.build_vocab(train, min_freq=config.token_min_freq)
 
+    return (token_field.vocab, train, val, test)
+
+
+def create_dataset(config: Config, device: torch.device) -> Tuple[Vocab, Iterator, Iterator, Iterator]:
+
+    fields = create_fields(config)
+    (vocab, train, val, test) = load_splits(config, fields)
+
     batch_size = config.batch_size
     train_iter, val_iter, test_iter = \
         Iterator.splits((train, val, test),
@@ -150,4 +167,101 @@ def create_dataset(config: Config, device: torch.device) -> Tuple[Vocab, Iterato
                         repeat=False,
                         sort=False)
 
-    return (token_field.vocab, train_iter, val_iter, test_iter)
+    return (vocab, train_iter, val_iter, test_iter)
+
+
+class TensorBatch:
+    '''A mini-batch with the same attributes as :class:`torchtext.data.Batch`
+    '''
+
+    def __init__(self, batch_size: int, vals: Dict[str, Any]):
+
+        self.batch_size = batch_size
+        for (name, val) in vals.items():
+            setattr(self, name, val)
+
+
+class SharedDataset:
+    '''Examples of a split numericalized once into tensors placed in shared memory
+
+    Processes which receive this object read the same pages
+    instead of re-reading and re-tensorizing the alignments.
+    '''
+
+    def __init__(self, dataset: Dataset, vocab: Vocab):
+
+        self.article_ids = [getattr(example, SeqType.ArticleID.value) for example in dataset.examples]
+        self.tensors = dict()
+        for (name, field) in dataset.fields.items():
+            if name == SeqType.ArticleID.value:
+                continue
+            tensor = field.process([getattr(example, name) for example in dataset.examples])
+            self.tensors[name] = tensor.share_memory_()
+
+        # Tokens are padded to the longest sentence of the whole split,
+        # so each mini-batch is cut down to its own longest sentence
+        i_padding = vocab.stoi[SpecialToken.Padding.value]
+        self.lengths = (self.tensors[SeqType.Token.value] != i_padding).sum(dim=0).share_memory_()
+
+    def __len__(self) -> int:
+        return len(self.article_ids)
+
+    def batch(self, indices: List[int], device: torch.device) -> TensorBatch:
+
+        index = torch.tensor(indices, dtype=torch.long)
+        vals = {SeqType.ArticleID.value: [self.article_ids[i] for i in indices]}
+        for (name, tensor) in self.tensors.items():
+            if name == SeqType.Token.value:
+                max_n_tokens = int(self.lengths[index].max())
+                vals[name] = tensor[:max_n_tokens, index].to(device)
+            else:
+                vals[name] = tensor[index].to(device)
+        return TensorBatch(len(indices), vals)
+
+
+class SharedIterator:
+    '''Iterate over a :class:`SharedDataset` like :class:`torchtext.data.Iterator`
+    '''
+
+    def __init__(self, dataset: SharedDataset, batch_size: int, device: torch.device, shuffle: bool):
+
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.device = device
+        self.shuffle = shuffle
+        self.random = random.Random(SEED)
+
+    def __len__(self) -> int:
+        return math.ceil(len(self.dataset) / self.batch_size)
+
+    def __iter__(self) -> Generator[TensorBatch, None, None]:
+        n = len(self.dataset)
+        order = self.random.sample(range(n), n) \
+            if self.shuffle \
+            else list(range(n))
+        for i in range(0, n, self.batch_size):
+            yield self.dataset.batch(order[i:i + self.batch_size], self.device)
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {'random_state': self.random.getstate()}
+
+    def load_state_dict(self, state_dict: Dict[str, Any]) -> None:
+        self.random.setstate(state_dict['random_state'])
+
+
+def create_shared_dataset(config: Config) -> Tuple[Vocab, Dict[Phase, SharedDataset]]:
+
+    fields = create_fields(config)
+    (vocab, train, val, test) = load_splits(config, fields)
+    return (vocab, {Phase.Train: SharedDataset(train, vocab),
+                    Phase.Valid: SharedDataset(val, vocab),
+                    Phase.Test: SharedDataset(test, vocab)})
+
+
+def create_shared_iterators(datasets: Dict[Phase, SharedDataset],
+                            batch_size: int,
+                            device: torch.device) -> Tuple[SharedIterator, SharedIterator, SharedIterator]:
+
+    return (SharedIterator(datasets[Phase.Train], batch_size, device, shuffle=True),
+            SharedIterator(datasets[Phase.Valid], batch_size, device, shuffle=False),
+            SharedIterator(datasets[Phase.Test], batch_size, device, shuffle=False))
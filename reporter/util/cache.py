@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, Union
+
+# Distinguishes a cached `None` from a miss
+MISSING = object()
+
+
+class LRUCache:
+    '''A bounded in-process cache which evicts the least recently used entry
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.put('a', 1)
+    >>> cache.put('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.put('c', 3)
+    >>> cache.get('b') is MISSING
+    True
+    >>> (cache.hits, cache.misses)
+    (1, 1)
+    '''
+
+    def __init__(self, maxsize: int):
+
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Any:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+    def put(self, key: Hashable, val: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = val
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+def _identity(val: Any) -> Any:
+    return val
+
+
+class SQLiteCache:
+    '''A bounded cache of JSON values in a SQLite file shared by processes
+
+    Every process (e.g. a uwsgi worker) opens its own connection after forking.
+    Entries are evicted in the order of their last access once there are more than ``maxsize``.
+    Hits and misses are counted per process.
+    With ``raw=True``, values are strings or bytes stored as they are, e.g. serialized responses.
+    '''
+
+    def __init__(self, dest: Path, maxsize: int, raw: bool = False):
+
+        self.dest = dest
+        self.maxsize = maxsize
+        self.encode = _identity if raw else json.dumps
+        self.decode = _identity if raw else json.loads
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connection = None
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(key TEXT PRIMARY KEY, val TEXT NOT NULL, accessed REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(str(self.dest), timeout=10.0, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.pid = os.getpid()
+        return self.connection
+
+    def get(self, key: str) -> Any:
+        with self.lock, self._connect() as connection:
+            row = connection.execute('SELECT val FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return MISSING
+            connection.execute('UPDATE cache SET accessed = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+            return self.decode(row[0])
+
+    def put(self, key: str, val: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self.lock, self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO cache (key, val, accessed) VALUES (?, ?, ?)',
+                               (key, self.encode(val), time.time()))
+            connection.execute('DELETE FROM cache WHERE key IN '
+                               '(SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                               (self.maxsize,))
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock, self._connect() as connection:
+            return connection.execute('SELECT 1 FROM cache WHERE key = ?', (key,)).fetchone() is not None
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self.lock, self._connect() as connection:
+            connection.execute('DELETE FROM cache WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
+
+    def clear(self) -> None:
+        with self.lock, self._connect() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def __len__(self) -> int:
+        with self.lock, self._connect() as connection:
+            return connection.execute('SELECT count(*) FROM cache').fetchone()[0]
+
+    def stats(self) -> Dict[str, Union[int, str]]:
+        return {'size': len(self), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -2,6 +2,7 @@ import os
 from datetime import datetime
 from logging import Logger
 from pathlib import Path
+from typing import Any, Dict, Union
 
 import toml
 
@@ -16,11 +17,16 @@ class Span:
 
 class Config:
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, overrides: Union[Dict[str, Dict[str, Any]], None] = None):
 
         self.filename = filename
         config = toml.load(self.filename)
 
+        # e.g. {'train': {'learning_rate': 1e-3}} replaces `learning_rate` in `[train]`
+        self.overrides = {} if overrides is None else overrides
+        for (section, values) in self.overrides.items():
+            config.setdefault(section, {}).update(values)
+
         location = config.get('location', {})
         self.dir_resources = Path(location.get('dir_resources', 'resources'))
         self.dir_logs = Path(location.get('dir_logs', 'logs'))
@@ -43,9 +49,12 @@ class Config:
         self.use_standardization = bool(train.get('use_standardization', False))
         self.use_init_token_tag = bool(train.get('use_init_token_tag', True))
         self.patience = int(train.get('patience', 10))
+        self.checkpoint_interval = int(train.get('checkpoint_interval', 1))
 
         self.db_uri = config.get('postgres', {}).get('uri')
         self.db_uri_test = config.get('postgres-test', {}).get('uri')
+        # The same query run more times than this by a request or a stage is logged as a warning
+        self.query_warn_threshold = int(config.get('postgres', {}).get('query_warn_threshold', 20))
 
         s3 = config.get('s3', {})
         self.use_aws_env_variables = s3.get('use_aws_env_variables', True)
@@ -78,12 +87,35 @@ class Config:
 
         self.n_items_per_page = config.get('webapp', {}).get('n_items_per_page', 20)
         self.demo_initial_date = config.get('webapp', {}).get('demo_initial_date', None)
+        self.prediction_cache_size = int(config.get('webapp', {}).get('prediction_cache_size', 1024))
+        self.prediction_cache_disk_size = int(config.get('webapp', {}).get('prediction_cache_disk_size', 100000))
+        self.prediction_cache_path = \
+            Path(config.get('webapp', {}).get('prediction_cache_path',
+                                              str(self.dir_output / Path('prediction-cache.sqlite3'))))
+        self.mmap_weights = bool(config.get('webapp', {}).get('mmap_weights', False))
+        self.lazy_startup = bool(config.get('webapp', {}).get('lazy_startup', False))
+        self.webapp_cache_size = int(config.get('webapp', {}).get('cache_size', 10000))
+        self.webapp_cache_path = \
+            Path(config.get('webapp', {}).get('cache_path',
+                                              str(self.dir_output / Path('webapp-cache.sqlite3'))))
+        self.chart_cache_size = int(config.get('webapp', {}).get('chart_cache_size', 4096))
+        self.chart_cache_path = \
+            Path(config.get('webapp', {}).get('chart_cache_path',
+                                              str(self.dir_output / Path('chart-cache.sqlite3'))))
+        self.warm_adjacent_days = bool(config.get('webapp', {}).get('warm_adjacent_days', True))
+        self.range_n_points = int(config.get('webapp', {}).get('range_n_points', 1000))
+        self.range_max_points = int(config.get('webapp', {}).get('range_max_points', 10000))
+        self.data_version = str(config.get('webapp', {}).get('data_version', '1'))
+        self.http_max_age = int(config.get('webapp', {}).get('http_max_age', 86400))
+        self.max_batch_size = int(config.get('webapp', {}).get('max_batch_size', 16))
+        self.max_wait_ms = float(config.get('webapp', {}).get('max_wait_ms', 5.0))
 
         self.result = dict([(m, Path(p)) for (m, p)
                             in config.get('webapp', {}).get('result', [])])
 
     def write_log(self, logger: Logger):
         s = '\n'.join(['load configuration from: {}'.format(self.filename),
+                       'overrides: {}'.format(self.overrides),
                        'n_epochs: {}'.format(self.n_epochs),
                        'batch_size: {}'.format(self.batch_size),
                        'learning_rate: {}'.format(self.learning_rate),
@@ -93,6 +125,7 @@ class Config:
                        'use_standardization: {}'.format(self.use_standardization),
                        'use_init_token_tag: {}'.format(self.use_init_token_tag),
                        'patience: {}'.format(self.patience),
+                       'checkpoint_interval: {}'.format(self.checkpoint_interval),
                        'enc_hidden_size: {}'.format(self.enc_hidden_size),
                        'enc_n_layers: {}'.format(self.enc_n_layers),
                        'base_ric_hidden_size: {}'.format(self.base_ric_hidden_size),
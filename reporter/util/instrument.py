@@ -0,0 +1,164 @@
+import json
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Generator, Union
+
+import torch
+
+
+class _NullContext:
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *args: Any) -> None:
+        return None
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class _PhaseTimer:
+
+    def __init__(self, instrument: 'Instrument', name: str):
+        self.instrument = instrument
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args: Any) -> None:
+        self.instrument.phases[self.name] += time.perf_counter() - self.start
+
+
+def peak_rss_mb() -> float:
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS reports bytes
+    return maxrss / 2 ** 20 if sys.platform == 'darwin' else maxrss / 2 ** 10
+
+
+def memory_usage_mb() -> Dict[str, float]:
+    '''RSS of this process split into shared and private pages, and PSS
+
+    PSS divides each shared page by the number of processes mapping it,
+    so the sum of PSS over workers is their actual footprint.
+    Only Linux reports the split, elsewhere only the peak RSS is returned.
+    '''
+    src = Path('/proc/self/smaps_rollup')
+    if not src.is_file():
+        return {'peak_rss': peak_rss_mb()}
+
+    kb = defaultdict(int)
+    with src.open(mode='r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == 'kB':
+                kb[fields[0].rstrip(':')] += int(fields[1])
+    return {'rss': kb['Rss'] / 2 ** 10,
+            'pss': kb['Pss'] / 2 ** 10,
+            'shared': (kb['Shared_Clean'] + kb['Shared_Dirty']) / 2 ** 10,
+            'private': (kb['Private_Clean'] + kb['Private_Dirty']) / 2 ** 10,
+            'peak_rss': peak_rss_mb()}
+
+
+class Instrument:
+    '''Per-stage timers and counters written as JSON lines
+
+    Each :meth:`record` block (an epoch, or a stage such as alignment) becomes one line
+    with the wall time of the phases measured inside it, counters, throughput, and peak RSS.
+    When ``dest`` is ``None``, every method returns immediately.
+
+    >>> instrument = Instrument(None)
+    >>> with instrument.phase('train.forward'):
+    ...     pass
+    >>> instrument.phases
+    {}
+    '''
+
+    def __init__(self,
+                 dest: Union[Path, None],
+                 mode: str = 'w',
+                 profile_epochs: Union[range, None] = None):
+
+        self.enabled = dest is not None
+        self.dest = dest
+        self.profile_epochs = range(0) if profile_epochs is None else profile_epochs
+        self.phases = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.f = None
+        if self.enabled:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            self.f = dest.open(mode=mode)
+
+    def phase(self, name: str) -> Union[_PhaseTimer, _NullContext]:
+        return _PhaseTimer(self, name) if self.enabled else _NULL_CONTEXT
+
+    def count(self, name: str, n: int) -> None:
+        if self.enabled:
+            self.counters[name] += n
+
+    @contextmanager
+    def record(self, **labels: Any) -> Generator[None, None, None]:
+
+        if not self.enabled:
+            yield
+            return
+
+        self.phases.clear()
+        self.counters.clear()
+
+        epoch = labels.get('epoch')
+        profiler = torch.autograd.profiler.profile() \
+            if epoch is not None and epoch in self.profile_epochs \
+            else None
+
+        start = time.perf_counter()
+        if profiler is not None:
+            with profiler:
+                yield
+            profiler.export_chrome_trace(str(self.dest.parent / Path('trace-epoch-{}.json'.format(epoch))))
+        else:
+            yield
+        wall_time = time.perf_counter() - start
+
+        self.f.write(json.dumps({**labels,
+                                 'wall_time': wall_time,
+                                 'phases': dict(self.phases),
+                                 'counters': dict(self.counters),
+                                 'throughput': self._throughput(),
+                                 'peak_rss_mb': peak_rss_mb()}) + '\n')
+        self.f.flush()
+
+    def _throughput(self) -> Dict[str, Dict[str, float]]:
+        '''Examples and tokens per second of each phase run, e.g. ``train``
+        '''
+        result = dict()
+        for (name, seconds) in self.phases.items():
+            n_examples = self.counters.get(name + '.examples')
+            if n_examples is None or seconds <= 0.0:
+                continue
+            result[name] = {'examples_per_sec': n_examples / seconds,
+                            'tokens_per_sec': self.counters.get(name + '.tokens', 0) / seconds}
+        return result
+
+    def close(self) -> None:
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+def parse_epoch_range(s: str) -> range:
+    '''
+    >>> parse_epoch_range('2:4')
+    range(2, 4)
+    >>> parse_epoch_range('3')
+    range(3, 4)
+    '''
+    if ':' in s:
+        start, end = s.split(':', 1)
+        return range(int(start), int(end))
+    return range(int(s), int(s) + 1)
@@ -3,14 +3,18 @@ import logging.config
 from pathlib import Path
 
 
-def create_logger(dest_log: Path, is_debug: bool, is_temporary: bool = False) -> logging.Logger:
+def create_logger(dest_log: Path,
+                  is_debug: bool,
+                  is_temporary: bool = False,
+                  mode: str = 'w',
+                  name: str = __name__) -> logging.Logger:
 
     DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
 
     dest_log.parent.mkdir(parents=True, exist_ok=True)
 
-    logger = logging.getLogger(__name__)
+    logger = logging.getLogger(name)
     logging.basicConfig()
 
     level = logging.DEBUG if is_debug else logging.INFO
@@ -24,7 +28,7 @@ def create_logger(dest_log: Path, is_debug: bool, is_temporary: bool = False) ->
     logger.addHandler(stream_handler)
 
     if not is_temporary:
-        file_handler = logging.FileHandler(filename=str(dest_log), mode='w')
+        file_handler = logging.FileHandler(filename=str(dest_log), mode=mode)
         file_handler.setLevel(level)
         file_handler.setFormatter(logging.Formatter(fmt=FORMAT, datefmt=DATE_FORMAT))
         logger.addHandler(file_handler)
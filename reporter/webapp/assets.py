@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import sass
+
+DIR_SCSS = Path('reporter/webapp/static/scss')
+DIR_CSS = Path('reporter/webapp/static/css')
+
+
+def is_compiled(dir_scss: Path = DIR_SCSS, dir_css: Path = DIR_CSS) -> bool:
+    '''Whether every stylesheet is newer than its SCSS source
+    '''
+    for src in dir_scss.glob('[!_]*.scss'):
+        dest = dir_css / src.with_suffix('.css').name
+        if not dest.is_file() or dest.stat().st_mtime < src.stat().st_mtime:
+            return False
+    return True
+
+
+def compile_scss(dir_scss: Path = DIR_SCSS, dir_css: Path = DIR_CSS) -> None:
+    sass.compile(dirname=(str(dir_scss.resolve()), str(dir_css.resolve())), output_style='expanded')
+
+
+def main() -> None:
+    compile_scss()
+
+
+if __name__ == '__main__':
+    main()
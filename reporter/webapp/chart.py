@@ -1,40 +1,91 @@
 from datetime import datetime, timedelta
 from itertools import groupby
-from typing import Dict, Iterable, List, Tuple
+from typing import Any, Dict, Iterable, List, Tuple, Union
 
-from sqlalchemy import Date, cast
+import numpy
+from sqlalchemy import Float, cast, extract
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql import text
 
-from reporter.database.misc import in_jst
+from reporter.database.misc import jst_day_range
 from reporter.database.model import Close, Price
-from reporter.database.read import fetch_prices_of_a_day
-from reporter.util.constant import UTC
-
-
-def fetch_points(session: Session, ric: str, start: datetime, end: datetime) -> Tuple[List[int], List[str]]:
-
-    ts = []
-    ps = []
-    t_prev_step = start
-
-    for t, p in fetch_prices_of_a_day(session, ric, end):
-        diff = t - t_prev_step
-        if diff.seconds > 5 * 60:
-            t_next_step = t_prev_step + timedelta(seconds=5 * 60)
-            ts.append(t_next_step.astimezone(UTC))
-            ps.append(None)
-            while (t - t_next_step).seconds > 5 * 60:
-                t_next_step += timedelta(seconds=5 * 60)
-                ts.append(t_next_step.astimezone(UTC))
-                ps.append(None)
-
-        ts.append(t.astimezone(UTC))
-        ps.append(str(p) if t <= end else None)
-
-        t_prev_step = t
-
-    return ts, ps
+from reporter.util.constant import JST
+from reporter.webapp.downsample import DOWNSAMPLERS
+
+STEP_SECONDS = 5 * 60
+
+
+def fetch_arrays_of_a_day(session: Session, ric: str, jst: datetime) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    '''Epochs and values of the prices of a day in JST
+    '''
+    (start, end) = jst_day_range(jst.date())
+    rows = session \
+        .query(extract('epoch', Price.t), cast(Price.val, Float)) \
+        .filter(Price.ric == ric, Price.t >= start, Price.t < end) \
+        .order_by(Price.t) \
+        .all()
+    array = numpy.array(rows, dtype=numpy.float64).reshape(-1, 2)
+    return (array[:, 0], array[:, 1])
+
+
+def fill_gaps(epochs: numpy.ndarray,
+              vals: numpy.ndarray,
+              start: float,
+              stop: float,
+              step: int = STEP_SECONDS) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    '''Place sorted values on the grid of ``step`` seconds from ``start`` to ``stop``
+
+    A grid point takes the first value of its step, and NaN if there is none.
+
+    >>> xs, ys = fill_gaps(numpy.array([0., 300., 1200.]), numpy.array([1., 2., 3.]), 0., 1500.)
+    >>> xs.tolist()
+    [0.0, 300.0, 600.0, 900.0, 1200.0, 1500.0]
+    >>> ys.tolist()
+    [1.0, 2.0, nan, nan, 3.0, nan]
+    '''
+    n = max(0, int((stop - start) // step) + 1)
+    xs = start + step * numpy.arange(n, dtype=numpy.float64)
+    ys = numpy.full(n, numpy.nan)
+
+    indices = numpy.floor((epochs - start) / step).astype(numpy.int64)
+    inside = (indices >= 0) & (indices < n)
+    (indices, firsts) = numpy.unique(indices[inside], return_index=True)
+    ys[indices] = vals[inside][firsts]
+    return (xs, ys)
+
+
+def fetch_points(session: Session,
+                 ric: str,
+                 start: datetime,
+                 end: datetime,
+                 stop: Union[datetime, None] = None) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    '''Prices of the day of ``end`` on the 5-minute grid from ``start``
+
+    The grid lasts until ``stop``, or until the last price of the day by default.
+    Prices after ``end`` are NaN.
+    '''
+    (epochs, vals) = fetch_arrays_of_a_day(session, ric, end)
+    if stop is not None:
+        last = stop.timestamp()
+    elif len(epochs) > 0:
+        last = epochs[-1]
+    else:
+        last = start.timestamp()
+
+    (xs, ys) = fill_gaps(epochs, vals, start.timestamp(), last)
+    ys[xs > end.timestamp()] = numpy.nan
+    return (xs, ys)
+
+
+def to_json_list(array: numpy.ndarray) -> List[Union[float, None]]:
+    '''Replace NaN, which JSON cannot express, with ``None``
+
+    >>> to_json_list(numpy.array([1.5, numpy.nan]))
+    [1.5, None]
+    '''
+    result = array.astype(object)
+    result[numpy.isnan(array)] = None
+    return result.tolist()
 
 
 def _xs_ys_of_group(iter: Iterable[Tuple[float, float, float]]) -> Dict[str, List[float]]:
@@ -68,9 +119,10 @@ def fetch_all_points_fast(session: Session, rics: List[str], start: datetime, en
 
 
 def fetch_close(session: Session, ric: str, jst: datetime) -> float:
+    (start, end) = jst_day_range(jst.date())
     result = session \
         .query(Price.val) \
-        .filter(cast(in_jst(Close.t), Date) == jst.date(), Close.ric == ric, Close.t == Price.t, Price.ric == ric) \
+        .filter(Close.ric == ric, Close.t >= start, Close.t < end, Close.t == Price.t, Price.ric == ric) \
         .scalar()
     return float(result) if result is not None else None
 
@@ -92,3 +144,86 @@ def fetch_all_closes_fast(session: Session, rics: List[str], start: datetime, en
     result = session.bind.execute(sql, start=start, end=end, **ric_dict)
     result = dict(list(result))
     return result
+
+
+def fetch_range_arrays(session: Session,
+                       rics: List[str],
+                       start: datetime,
+                       end: datetime) -> Dict[str, Tuple[numpy.ndarray, numpy.ndarray]]:
+    '''Epochs and values of every price in [start, end)
+    '''
+    sql = text("""
+               SELECT ric, EXTRACT(epoch FROM t) ::float AS t, val ::float
+               FROM prices
+               WHERE ric = ANY(:rics) AND t >= :start AND t < :end AND val IS NOT NULL
+               ORDER BY ric, t
+               """)
+    result = session.execute(sql, {'rics': list(rics), 'start': start, 'end': end})
+    arrays = {ric: (numpy.empty(0), numpy.empty(0)) for ric in rics}
+    for (ric, rows) in groupby(result, lambda r: r.ric):
+        array = numpy.array([(r.t, r.val) for r in rows], dtype=numpy.float64)
+        arrays[ric] = (array[:, 0], array[:, 1])
+    return arrays
+
+
+def fetch_daily_arrays(session: Session,
+                       rics: List[str],
+                       start: datetime,
+                       end: datetime) -> Dict[str, Tuple[numpy.ndarray, numpy.ndarray]]:
+    '''The lows and the highs of the days in JST in [start, end) in the order of time
+    '''
+    sql = text("""
+               SELECT ric,
+                      EXTRACT(epoch FROM t_low) ::float AS t_low, low,
+                      EXTRACT(epoch FROM t_high) ::float AS t_high, high
+               FROM daily_prices
+               WHERE ric = ANY(:rics) AND day >= :start AND day <= :end
+               ORDER BY ric, day
+               """)
+    result = session.execute(sql, {'rics': list(rics),
+                                   'start': start.astimezone(JST).date(),
+                                   'end': (end - timedelta(microseconds=1)).astimezone(JST).date()})
+    arrays = {ric: (numpy.empty(0), numpy.empty(0)) for ric in rics}
+    for (ric, rows) in groupby(result, lambda r: r.ric):
+        array = numpy.array([(r.t_low, r.low, r.t_high, r.high) for r in rows], dtype=numpy.float64)
+        xs = array[:, [0, 2]]
+        ys = array[:, [1, 3]]
+        order = numpy.argsort(xs, axis=1)
+        arrays[ric] = (numpy.take_along_axis(xs, order, axis=1).ravel(),
+                       numpy.take_along_axis(ys, order, axis=1).ravel())
+    return arrays
+
+
+def fetch_range_chart(session: Session,
+                      rics: List[str],
+                      start: datetime,
+                      end: datetime,
+                      n_points: int,
+                      method: str) -> Dict[str, Any]:
+    '''Prices in [start, end) downsampled to at most ``n_points`` per RIC
+
+    A day in `daily_prices` gives two points, its low and its high.
+    When the range has as many days as half of ``n_points``, they are drawn from these rows
+    instead of every price.
+    '''
+    n_days = (end - start) / timedelta(days=1)
+    resolution = 'day' if 2 * n_days >= n_points else 'price'
+    series = fetch_daily_arrays(session, rics, start, end) \
+        if resolution == 'day' \
+        else {}
+    if all(len(xs) == 0 for (xs, _) in series.values()):
+        # `daily_prices` is filled by `python -m reporter.webapp.warm`
+        resolution = 'price'
+        series = fetch_range_arrays(session, rics, start, end)
+
+    downsample = DOWNSAMPLERS[method]
+    prices = {}
+    for ric in rics:
+        (xs, ys) = downsample(*series[ric], n_points)
+        prices[ric] = {'xs': xs.tolist(), 'ys': ys.tolist()}
+
+    return {'start': start.timestamp(),
+            'end': end.timestamp(),
+            'method': method,
+            'resolution': resolution,
+            'prices': prices}
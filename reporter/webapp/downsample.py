@@ -0,0 +1,62 @@
+from typing import Tuple
+
+import numpy
+
+
+def lttb(xs: numpy.ndarray, ys: numpy.ndarray, n_out: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    '''Largest-Triangle-Three-Buckets downsampling of a series sorted by ``xs``
+
+    The first and the last points are kept, and each of the ``n_out - 2`` buckets between them
+    keeps the point which forms the largest triangle with the point kept in the previous bucket
+    and the average of the next bucket.
+
+    >>> xs, ys = lttb(numpy.arange(7.), numpy.array([0., 1., 0., 5., 0., 1., 0.]), 3)
+    >>> (xs.tolist(), ys.tolist())
+    ([0.0, 3.0, 6.0], [0.0, 5.0, 0.0])
+    '''
+    n = len(xs)
+    if n_out >= n or n_out < 3:
+        return (xs, ys)
+
+    # The boundaries of the buckets of the points except the first and the last
+    edges = numpy.floor(numpy.linspace(1, n - 1, n_out - 1)).astype(numpy.int64)
+    selected = numpy.empty(n_out, dtype=numpy.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    for i in range(n_out - 2):
+        (start, end) = (edges[i], edges[i + 1])
+        if i + 2 < len(edges):
+            (next_x, next_y) = (xs[end:edges[i + 2]].mean(), ys[end:edges[i + 2]].mean())
+        else:
+            (next_x, next_y) = (xs[-1], ys[-1])
+        (prev_x, prev_y) = (xs[selected[i]], ys[selected[i]])
+        areas = numpy.abs((prev_x - next_x) * (ys[start:end] - prev_y) -
+                          (prev_x - xs[start:end]) * (next_y - prev_y))
+        selected[i + 1] = start + numpy.argmax(areas)
+
+    return (xs[selected], ys[selected])
+
+
+def minmax(xs: numpy.ndarray, ys: numpy.ndarray, n_out: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    '''Keep the minimum and the maximum of each of ``n_out // 2`` buckets in the order of ``xs``
+
+    >>> xs, ys = minmax(numpy.arange(6.), numpy.array([3., 1., 2., 4., 6., 5.]), 2)
+    >>> (xs.tolist(), ys.tolist())
+    ([1.0, 4.0], [1.0, 6.0])
+    '''
+    n = len(xs)
+    n_buckets = max(1, n_out // 2)
+    if n <= n_out or n == 0:
+        return (xs, ys)
+
+    buckets = numpy.arange(n) * n_buckets // n
+    # Sorted by bucket and then by value, the first of a bucket is its minimum and the last its maximum
+    order = numpy.lexsort((ys, buckets))
+    firsts = numpy.searchsorted(buckets[order], numpy.arange(n_buckets), side='left')
+    lasts = numpy.searchsorted(buckets[order], numpy.arange(n_buckets), side='right') - 1
+    selected = numpy.unique(numpy.concatenate([order[firsts], order[lasts]]))
+    return (xs[selected], ys[selected])
+
+
+DOWNSAMPLERS = {'lttb': lttb, 'minmax': minmax}
@@ -0,0 +1,31 @@
+import hashlib
+import http
+from typing import Union
+
+import flask
+
+
+def compute_etag(*parts: str) -> str:
+    '''A strong validator of a response determined by ``parts``
+
+    >>> compute_etag('1', '.N225,.TOPIX', '1538492400')
+    '3f4c3cf33e0817f9429e221d539d7bd57936d030'
+    '''
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag: str, max_age: int) -> Union[flask.Response, None]:
+    '''Answer a conditional request which the client can serve from its cache
+
+    Return ``None`` when the response has to be built.
+    '''
+    if not flask.request.if_none_match.contains(etag):
+        return None
+    return with_etag(flask.current_app.response_class(status=http.HTTPStatus.NOT_MODIFIED), etag, max_age)
+
+
+def with_etag(response: flask.Response, etag: str, max_age: int) -> flask.Response:
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
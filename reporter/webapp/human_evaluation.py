@@ -1,94 +1,143 @@
+import argparse
 import csv
-import math
 import random
-from itertools import permutations
+import time
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, Iterable, Iterator, Tuple
 
-from sqlalchemy.orm.session import Session
+from sqlalchemy import Table
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import Session, sessionmaker
 from tqdm import tqdm
 
-from reporter.database.model import GenerationResult, HumanEvaluation
+from reporter.database.model import (
+    GenerationResult,
+    HumanEvaluation,
+    create_indexes,
+    create_table
+)
 from reporter.postprocessing.text import number2kansuuzi
+from reporter.util.cache import SQLiteCache
+from reporter.util.config import Config
+from reporter.webapp.search import COUNT_CACHE_PREFIX
 
 
-def populate_for_human_evaluation(session: Session,
-                                  method_to_result: Dict[str, Path]) -> None:
-
-    if session.query(HumanEvaluation).first() is not None:
-        return
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='reporter.webapp.human_evaluation')
+    parser.add_argument('--config',
+                        type=str,
+                        dest='dest_config',
+                        metavar='FILENAME',
+                        default='config.toml',
+                        help='specify config file (default: `config.toml`)')
+    return parser.parse_args()
 
-    if session.query(GenerationResult).first() is not None:
-        return
-
-    method_names = list(method_to_result.keys()) + ['Gold']
 
+def read_results(src: Path) -> Iterator[Tuple[str, str]]:
+    '''Article IDs and generated headlines of a CSV written by `reporter`
+    '''
     token_delim = '|'
-
-    with method_to_result['Base'].open(mode='r') as f:
-        N = sum(1 for _ in f) - 1
-        f.seek(0)
-
+    with src.open(mode='r') as f:
         reader = csv.reader(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
         next(reader)
-        for _ in tqdm(range(N)):
-            fields = next(reader)
-            article_id = fields[0]
-            base_result = GenerationResult(article_id,
-                                           'Base',
-                                           ''.join(number2kansuuzi(fields[4].split(token_delim)[:-1])))
-            session.add(base_result)
+        for fields in reader:
+            yield (fields[0], ''.join(number2kansuuzi(fields[4].split(token_delim)[:-1])))
 
-            gold_result = GenerationResult(article_id, 'Gold', None)
-            session.add(gold_result)
 
-        session.commit()
+def insert_in_chunks(session: Session, table: Table, rows: Iterable[Dict[str, Any]], chunk_size: int = 5000) -> None:
+    '''Insert rows with a multi-row `INSERT ... VALUES` per chunk instead of a statement per row
+    '''
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            session.execute(table.insert().values(chunk))
+            chunk = []
+    if len(chunk) > 0:
+        session.execute(table.insert().values(chunk))
 
-    for method_name in [m for m in method_names if m not in ['Base', 'Gold']]:
 
-        if not method_to_result[method_name].is_file():
-            continue
+TABLES_VERSION_KEY = 'tables-version'
 
-        with method_to_result[method_name].open(mode='r') as f:
-            N = sum(1 for _ in f) - 1
-            f.seek(0)
 
-            reader = csv.reader(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
-            next(reader)
-            for _ in tqdm(range(N)):
-                fields = next(reader)
-                article_id = fields[0]
-                result = GenerationResult(article_id,
-                                          method_name,
-                                          ''.join(number2kansuuzi(fields[4].split(token_delim)[:-1])))
-                session.add(result)
-        session.commit()
+def mark_tables_changed(cache: SQLiteCache) -> None:
+    '''Drop the numbers of rows of searches, which the workers share in ``cache``,
+    and bump the version which makes them rebuild their index of headlines
+    '''
+    cache.delete_prefix(COUNT_CACHE_PREFIX)
+    cache.put(TABLES_VERSION_KEY, time.time())
 
-    groups = session \
-        .query(GenerationResult.article_id) \
-        .filter(GenerationResult.result != '') \
-        .group_by(GenerationResult.article_id) \
-        .all()
 
-    orderings = list(permutations([m for m in method_names]))
+def tables_version(cache: SQLiteCache) -> Any:
+    return cache.get(TABLES_VERSION_KEY)
 
-    for group in groups:
 
-        i = random.randint(0, math.factorial(len(method_names)) - 1)
-        h = HumanEvaluation(group.article_id, ordering=orderings[i])
-        session.add(h)
+def populate_for_human_evaluation(session: Session,
+                                  method_to_result: Dict[str, Path]) -> bool:
+    '''Populate the tables for evaluation unless they have rows, and tell whether they were populated
+    '''
+    if session.query(HumanEvaluation).first() is not None:
+        return False
 
-    session.commit()
+    if session.query(GenerationResult).first() is not None:
+        return False
 
-    results = session.query(HumanEvaluation).all()
+    method_names = list(method_to_result.keys()) + ['Gold']
+
+    # Articles with any non-empty result are evaluated
+    article_ids = []
+    seen = set()
+
+    def generation_results(method_name: str) -> Iterator[Dict[str, Any]]:
+        for (article_id, result) in tqdm(read_results(method_to_result[method_name]), desc=method_name):
+            if result != '' and article_id not in seen:
+                seen.add(article_id)
+                article_ids.append(article_id)
+            yield {'article_id': article_id, 'method_name': method_name, 'result': result}
+            if method_name == 'Base':
+                yield {'article_id': article_id, 'method_name': 'Gold', 'result': None}
+
+    for method_name in [m for m in method_names if m != 'Gold']:
+        if method_name != 'Base' and not method_to_result[method_name].is_file():
+            continue
+        insert_in_chunks(session, GenerationResult.__table__, generation_results(method_name))
+    session.commit()
 
     SAMPLE_SIZE = 100
-    n_results = len(results)
+    targets = set(random.sample(article_ids, SAMPLE_SIZE)) \
+        if len(article_ids) >= SAMPLE_SIZE \
+        else set()
+
+    def human_evaluations() -> Iterator[Dict[str, Any]]:
+        for article_id in article_ids:
+            ordering = list(method_names)
+            random.shuffle(ordering)
+            yield {'article_id': article_id,
+                   'ordering': ordering,
+                   'is_target': article_id in targets if len(targets) > 0 else None}
+
+    insert_in_chunks(session, HumanEvaluation.__table__, human_evaluations())
+    session.commit()
+    return True
+
+
+def main() -> None:
+
+    args = parse_args()
+    config = Config(args.dest_config)
 
-    if n_results >= SAMPLE_SIZE:
-        sample_indices = random.sample(range(n_results), SAMPLE_SIZE)
+    engine = create_engine(config.db_uri)
+    create_table(engine, HumanEvaluation.__table__)
+    create_table(engine, GenerationResult.__table__)
+    create_indexes(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        populate_for_human_evaluation(session, config.result)
+        # Also run after inserting headlines, so that the running app follows them
+        mark_tables_changed(SQLiteCache(config.webapp_cache_path, config.webapp_cache_size))
+    finally:
+        session.close()
 
-        for i, result in enumerate(results):
-            result.is_target = i in sample_indices
 
-        session.commit()
+if __name__ == '__main__':
+    main()
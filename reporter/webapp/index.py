@@ -0,0 +1,150 @@
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Pattern, Union
+
+import numpy
+from sqlalchemy.orm.session import Session
+
+from reporter.database.model import Headline, HumanEvaluation
+
+INDEXED_FIELDS = ['simple_headline', 'tag_tokens']
+
+
+def like_to_regex(pattern: str) -> Pattern:
+    '''A regular expression matching the same strings as a pattern of `LIKE`
+
+    >>> like_to_regex('日経平均%反発_').fullmatch('日経平均、小反発。') is not None
+    True
+    '''
+    return re.compile(''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern),
+                      flags=re.DOTALL)
+
+
+def ngrams(s: str) -> List[str]:
+    '''The characters of a string shorter than 2, and its bigrams otherwise
+
+    >>> ngrams('高')
+    ['高']
+    >>> ngrams('日経平均')
+    ['日経', '経平', '平均']
+    '''
+    return [s] if len(s) < 2 else [s[i:i + 2] for i in range(len(s) - 1)]
+
+
+class TextIndex:
+    '''An inverted index from the characters and the bigrams of texts to their positions
+
+    The posting lists are sorted arrays of int32.
+    '''
+
+    def __init__(self, texts: List[Union[str, None]]):
+
+        self.texts = texts
+        postings = defaultdict(list)
+        for (i, text) in enumerate(texts):
+            if text is None:
+                continue
+            for gram in set(text) | set(ngrams(text)):
+                postings[gram].append(i)
+        self.postings = {gram: numpy.array(ids, dtype=numpy.int32) for (gram, ids) in postings.items()}
+
+    def like(self, pattern: str) -> numpy.ndarray:
+        '''The positions of the texts matching a pattern of `LIKE` without escapes
+
+        The texts containing every bigram of the literal parts of the pattern are verified.
+
+        >>> TextIndex(['日経平均、反発', '日経平均、反落', None]).like('%反発%').tolist()
+        [0]
+        '''
+        segments = [segment for segment in re.split('[%_]', pattern) if len(segment) > 0]
+        grams = sorted(set(gram for segment in segments for gram in ngrams(segment)),
+                       key=lambda gram: len(self.postings.get(gram, ())))
+
+        candidates = None
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                return numpy.empty(0, dtype=numpy.int32)
+            candidates = posting \
+                if candidates is None \
+                else numpy.intersect1d(candidates, posting, assume_unique=True)
+            if len(candidates) == 0:
+                return candidates
+        if candidates is None:
+            candidates = numpy.arange(len(self.texts), dtype=numpy.int32)
+
+        regex = like_to_regex(pattern)
+        return numpy.array([i for i in candidates.tolist()
+                            if self.texts[i] is not None and regex.fullmatch(self.texts[i]) is not None],
+                           dtype=numpy.int32)
+
+
+class HeadlineIndex:
+    '''Answer `like` on `simple_headline` and `tag_tokens`, and `=` on `tag_tokens`, in memory
+
+    Headlines have no word boundaries, so `LIKE '%...%'` scans the table.
+    The index covers the headlines in the evaluation lists, i.e. those in `human_evaluation`.
+    A pattern of `tag_tokens` is matched with the tokens joined by spaces.
+    '''
+
+    def __init__(self, article_ids: List[str], field_to_texts: Dict[str, List[Union[str, None]]],
+                 tokens: List[Union[List[str], None]]):
+
+        self.article_ids = numpy.array(article_ids, dtype=object)
+        self.field_to_index = {field: TextIndex(texts) for (field, texts) in field_to_texts.items()}
+        token_postings = defaultdict(list)
+        for (i, ts) in enumerate(tokens):
+            for token in set(ts or []):
+                token_postings[token].append(i)
+        self.token_postings = {token: numpy.array(ids, dtype=numpy.int32) for (token, ids) in token_postings.items()}
+
+    @staticmethod
+    def build(session: Session) -> 'HeadlineIndex':
+        rows = session \
+            .query(Headline.article_id, Headline.simple_headline, Headline.tag_tokens) \
+            .join(HumanEvaluation, HumanEvaluation.article_id == Headline.article_id) \
+            .all()
+        return HeadlineIndex([r.article_id for r in rows],
+                             {'simple_headline': [r.simple_headline for r in rows],
+                              'tag_tokens': [' '.join(r.tag_tokens) if r.tag_tokens is not None else None
+                                             for r in rows]},
+                             [r.tag_tokens for r in rows])
+
+    def like(self, field: str, pattern: str) -> List[str]:
+        return self.article_ids[self.field_to_index[field].like(pattern)].tolist()
+
+    def has_token(self, token: str) -> List[str]:
+        return self.article_ids[self.token_postings.get(token, numpy.empty(0, dtype=numpy.int32))].tolist()
+
+
+class LazyHeadlineIndex:
+    '''Build a :class:`HeadlineIndex` on the first search of each process
+
+    The index is built again when ``get_version`` returns another value,
+    e.g. after the headlines or the tables for evaluation are populated again.
+    '''
+
+    def __init__(self, create_session: Callable[[], Session], get_version: Callable[[], Any] = lambda: None):
+
+        self.create_session = create_session
+        self.get_version = get_version
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+
+    def get(self) -> HeadlineIndex:
+        version = self.get_version()
+        if self.index is not None and self.version == version:
+            return self.index
+        with self.lock:
+            if self.index is None or self.version != version:
+                self.index = HeadlineIndex.build(self.create_session())
+                self.version = version
+        return self.index
+
+    def like(self, field: str, pattern: str) -> List[str]:
+        return self.get().like(field, pattern)
+
+    def has_token(self, token: str) -> List[str]:
+        return self.get().has_token(token)
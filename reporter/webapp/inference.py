@@ -0,0 +1,229 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Union
+
+import torch
+
+from reporter.database.model import PregeneratedHeadline, create_table
+from reporter.database.read import fetch_pregenerated_headline
+from reporter.predict import Predictor
+from reporter.util.cache import MISSING, LRUCache, SQLiteCache
+from reporter.util.config import Config
+from reporter.util.constant import NIKKEI_DATETIME_FORMAT
+from reporter.webapp.metrics import observe_inference
+
+SLOT_MINUTES = 5
+
+
+def align_to_slot(t: datetime) -> datetime:
+    '''Round down to the beginning of a 5-minute slot
+
+    >>> from reporter.util.constant import JST
+    >>> align_to_slot(JST.localize(datetime(2018, 10, 3, 9, 3, 12)))
+    datetime.datetime(2018, 10, 3, 9, 0, tzinfo=<DstTzInfo 'Asia/Tokyo' JST+9:00:00 STD>)
+    '''
+    return t - timedelta(minutes=t.minute % SLOT_MINUTES, seconds=t.second, microseconds=t.microsecond)
+
+
+class InferenceWorker:
+    '''Run concurrent predictions as mini-batches on a background thread
+
+    A batch starts with the first waiting request, and takes in the requests
+    arriving within ``max_wait_ms`` up to ``max_batch_size``.
+    The same `(time, ric)` requested twice in a batch is predicted once.
+    '''
+
+    def __init__(self,
+                 predict_many: Callable[[List[Tuple[str, str]]], List[List[str]]],
+                 max_batch_size: int,
+                 max_wait_ms: float):
+
+        self.predict_many = predict_many
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+
+    def submit(self, t: str, ric: str) -> Future:
+        self._start()
+        future = Future()
+        self.queue.put(((t, ric), future))
+        return future
+
+    def _start(self) -> None:
+        # Threads do not survive the fork of a uwsgi worker
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._work, daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def _collect(self) -> List[Tuple[Tuple[str, str], Future]]:
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self) -> None:
+        while True:
+            batch = self._collect()
+            query_to_futures = dict()
+            for (query, future) in batch:
+                if future.set_running_or_notify_cancel():
+                    query_to_futures.setdefault(query, []).append(future)
+            if len(query_to_futures) == 0:
+                continue
+
+            queries = list(query_to_futures.keys())
+            start = time.perf_counter()
+            try:
+                sentences = self.predict_many(queries)
+                observe_inference(len(queries), time.perf_counter() - start)
+            except Exception as e:  # delivered to the waiting requests
+                for futures in query_to_futures.values():
+                    for future in futures:
+                        future.set_exception(e)
+                continue
+            for (query, sentence) in zip(queries, sentences):
+                for future in query_to_futures[query]:
+                    future.set_result(sentence)
+
+
+class CachedPredictor:
+    '''Serve headlines of a :class:`Predictor` through a memory cache and a SQLite file
+
+    Headlines are deterministic for a model and a 5-minute slot, so requests are aligned to slots
+    and keyed by the hash of `reporter.model` and `reporter.vocab`, the RIC, and the slot.
+    When the model files change on disk, the predictor is reloaded
+    and the entries of the previous model are dropped.
+    Misses are read from the headlines stored by :mod:`reporter.pregenerate` if any,
+    or else predicted together with concurrent requests by an :class:`InferenceWorker`.
+    '''
+
+    def __init__(self, config: Config, device: torch.device, output: Path):
+
+        self.config = config
+        self.device = device
+        self.output = output
+        self.memory = LRUCache(config.prediction_cache_size)
+        self.disk = SQLiteCache(config.prediction_cache_path, config.prediction_cache_disk_size)
+        self.lock = threading.Lock()
+        self.predictor = Predictor(config, device, output)
+        self.file_stats = self._stat_model_files()
+        create_table(self.predictor.engine, PregeneratedHeadline.__table__)
+        self.worker = InferenceWorker(lambda queries: self.predictor.predict_many(queries),
+                                      config.max_batch_size,
+                                      config.max_wait_ms)
+
+    def _stat_model_files(self) -> Tuple[Tuple[int, int], ...]:
+        return tuple((path.stat().st_mtime_ns, path.stat().st_size) for path in self.predictor.model_files)
+
+    def _reload_if_changed(self) -> None:
+        if self._stat_model_files() == self.file_stats:
+            return
+        with self.lock:
+            if self._stat_model_files() == self.file_stats:
+                return
+            prev_model_id = self.predictor.model_id
+            self.predictor = Predictor(self.config, self.device, self.output)
+            self.file_stats = self._stat_model_files()
+            self.memory.clear()
+            if self.predictor.model_id != prev_model_id:
+                self.disk.delete_prefix(prev_model_id + ':')
+
+    def predict(self, ric: str, t: datetime) -> List[str]:
+
+        self._reload_if_changed()
+
+        slot = align_to_slot(t)
+        model_id = self.predictor.model_id
+        key = '{}:{}:{}'.format(model_id, ric, int(slot.timestamp()))
+
+        sentence = self.memory.get(key)
+        if sentence is not MISSING:
+            return sentence
+
+        sentence = self.disk.get(key)
+        if sentence is MISSING:
+            sentence = self._fetch_pregenerated(model_id, ric, slot)
+            if sentence is None:
+                sentence = self.worker.submit(slot.strftime(NIKKEI_DATETIME_FORMAT), ric).result()
+            self.disk.put(key, sentence)
+        self.memory.put(key, sentence)
+        return sentence
+
+    def _fetch_pregenerated(self, model_id: str, ric: str, slot: datetime) -> Union[List[str], None]:
+        session = self.predictor.SessionMaker()
+        try:
+            return fetch_pregenerated_headline(session, model_id, ric, slot)
+        finally:
+            session.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {'memory': self.memory.stats(), 'disk': self.disk.stats()}
+
+
+class LazyPredictor:
+    '''Load a :class:`CachedPredictor` on a background thread
+
+    The app starts serving pages while the model is loading,
+    and `/predict` waits for the first load to finish.
+    '''
+
+    def __init__(self, config: Config, device: torch.device, output: Path):
+
+        self.config = config
+        self.device = device
+        self.output = output
+        self.lock = threading.Lock()
+        self.pid = None
+        self.future = None
+
+    def start(self) -> None:
+        # Threads do not survive the fork of a uwsgi worker
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.future = Future()
+            threading.Thread(target=self._load, args=(self.future,), daemon=True).start()
+            self.pid = os.getpid()
+
+    def _load(self, future: Future) -> None:
+        try:
+            future.set_result(CachedPredictor(self.config, self.device, self.output))
+        except Exception as e:  # re-raised by the requests
+            future.set_exception(e)
+
+    def get(self) -> CachedPredictor:
+        self.start()
+        return self.future.result()
+
+    def loaded(self) -> Union[CachedPredictor, None]:
+        '''The predictor if it has been loaded, without waiting
+        '''
+        if self.future is None or not self.future.done() or self.future.exception() is not None:
+            return None
+        return self.future.result()
+
+    def predict(self, ric: str, t: datetime) -> List[str]:
+        return self.get().predict(ric, t)
@@ -1,38 +1,60 @@
+import gc
 import http
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Union
 
 import flask
-import sass
 import torch
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import func, tuple_
 
+from reporter.database.instrument import QueryRecorder
 from reporter.database.misc import in_jst, in_utc
-from reporter.database.model import GenerationResult, Headline, HumanEvaluation
+from reporter.database.model import (
+    DailyPrice,
+    GenerationResult,
+    Headline,
+    HumanEvaluation,
+    create_indexes,
+    create_table
+)
 from reporter.database.read import (
     fetch_date_range,
     fetch_max_t_of_prev_trading_day,
     fetch_rics
 )
-from reporter.predict import Predictor
+from reporter.util.cache import MISSING, SQLiteCache
 from reporter.util.config import Config
-from reporter.util.constant import JST, NIKKEI_DATETIME_FORMAT, UTC, Code
-from reporter.webapp.chart import (
-    fetch_all_closes_fast,
-    fetch_all_points_fast,
-    fetch_close,
-    fetch_points
+from reporter.util.constant import JST, UTC, Code
+from reporter.util.instrument import memory_usage_mb
+from reporter.webapp.assets import compile_scss, is_compiled
+from reporter.webapp.chart import fetch_points, fetch_range_chart, to_json_list
+from reporter.webapp.downsample import DOWNSAMPLERS
+from reporter.webapp.etag import compute_etag, not_modified, with_etag
+from reporter.webapp.human_evaluation import (
+    mark_tables_changed,
+    populate_for_human_evaluation,
+    tables_version
+)
+from reporter.webapp.index import LazyHeadlineIndex
+from reporter.webapp.inference import CachedPredictor, LazyPredictor
+from reporter.webapp.metrics import install_metrics
+from reporter.webapp.search import (
+    COUNT_CACHE_PREFIX,
+    Cursor,
+    construct_constraint_query,
+    count_cache_key
 )
-from reporter.webapp.human_evaluation import populate_for_human_evaluation
-from reporter.webapp.search import construct_constraint_query
 from reporter.webapp.table import (
     Table,
     create_ric_tables,
-    load_ric_to_ric_info
+    load_ric_to_ric_info,
+    ric_tables_cache
 )
+from reporter.webapp.warm import ChartWarmer, build_day_chart, day_chart_key
+from reporter.webapp.wire import negotiate
 
 config = Config('config.toml')
 app = flask.Flask(__name__)
@@ -41,29 +63,69 @@ app.config['SQLALCHEMY_DATABASE_URI'] = config.db_uri
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.jinja_env.add_extension('pypugjs.ext.jinja.PyPugJSExtension')
 
-dir_scss = Path('reporter/webapp/static/scss').resolve()
-dir_css = Path('reporter/webapp/static/css').resolve()
-sass.compile(dirname=(str(dir_scss), str(dir_css)), output_style='expanded')
+# Stylesheets compiled in advance by `python -m reporter.webapp.assets` are kept
+if not is_compiled():
+    compile_scss()
 
 db = SQLAlchemy(app)
 
-ric_to_ric_info = load_ric_to_ric_info()
-populate_for_human_evaluation(db.session, config.result)
+# The tables for evaluation are populated in advance by `python -m reporter.webapp.human_evaluation`
+if not config.lazy_startup:
+    with app.app_context():
+        create_indexes(db.engine)
+        create_table(db.engine, DailyPrice.__table__)
+    populate_for_human_evaluation(db.session, config.result)
+webapp_cache = SQLiteCache(config.webapp_cache_path, config.webapp_cache_size)
+# The counts of searches kept by the previous run may be of other data
+mark_tables_changed(webapp_cache)
+# Searches of headlines are answered in memory, and the index built by the master is shared by the workers.
+# It is built again after `python -m reporter.webapp.human_evaluation` runs.
+headline_index = LazyHeadlineIndex(lambda: db.session, lambda: tables_version(webapp_cache))
+if not config.lazy_startup:
+    with app.app_context():
+        headline_index.get()
 demo_initial_date = config.demo_initial_date
+chart_cache = SQLiteCache(config.chart_cache_path, config.chart_cache_size, raw=True)
+chart_warmer = ChartWarmer(config, chart_cache)
 
 device = os.environ.get('DEVICE', 'cpu')
 output = os.environ.get('OUTPUT')
 
-predictor = Predictor(config, torch.device(device), Path(output)) \
-    if output is not None and Path(output).exists() \
-    else None
-
-# TODO move to some util/misc module?
-EPOCH = datetime.fromtimestamp(0, tz=UTC)
-
-
-def epoch(dt: datetime) -> float:
-    return (dt - EPOCH).total_seconds()
+if output is None or not Path(output).exists():
+    predictor = None
+elif config.lazy_startup:
+    predictor = LazyPredictor(config, torch.device(device), Path(output))
+    predictor.start()
+else:
+    predictor = CachedPredictor(config, torch.device(device), Path(output))
+
+
+def get_caches() -> Dict[str, Any]:
+    caches = {'webapp': webapp_cache, 'chart': chart_cache, 'ric_tables': ric_tables_cache}
+    loaded = predictor.loaded() \
+        if isinstance(predictor, LazyPredictor) \
+        else predictor
+    if loaded is not None:
+        caches.update({'prediction_memory': loaded.memory, 'prediction_disk': loaded.disk})
+    return caches
+
+
+recorder = QueryRecorder(app.logger, config.query_warn_threshold)
+with app.app_context():
+    recorder.attach(db.engine)
+if isinstance(predictor, CachedPredictor):
+    recorder.attach(predictor.predictor.engine)
+install_metrics(app, recorder, get_caches)
+
+# With `lazy-apps = false`, uwsgi imports this module once in the master and forks the workers.
+# Connections must not be shared by the workers, and the objects loaded so far
+# (e.g. the model) are moved out of reach of the garbage collector,
+# which would otherwise write to their pages and make each worker copy them.
+with app.app_context():
+    db.engine.dispose()
+if isinstance(predictor, CachedPredictor):
+    predictor.predictor.engine.dispose()
+gc.freeze()
 
 
 class EvalTarget:
@@ -96,10 +158,17 @@ class EvalListRow:
 
 
 class DummyPagination:
-    def __init__(self, has_prev: bool, has_next: bool, display_msg: str):
+    def __init__(self,
+                 has_prev: bool,
+                 has_next: bool,
+                 display_msg: str,
+                 prev_cursor: Union[str, None] = None,
+                 next_cursor: Union[str, None] = None):
         self.has_prev = has_prev
         self.has_next = has_next
         self.display_msg = display_msg
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
 
 
 def order_method_names_for_debug(method_names: List[str]) -> List[str]:
@@ -123,16 +192,32 @@ def index() -> flask.Response:
 
 def list_targets_of_human_evaluation(is_debug: bool) -> flask.Response:
     args = flask.request.args
-    page = int(args.get('page', default=1))
+    cursor = None
+    if args.get('cursor') is not None:
+        cursor = Cursor.decode(args.get('cursor'))
+        if cursor is None:
+            flask.abort(http.HTTPStatus.BAD_REQUEST)
     conditions = []
     for i in range(5):
         field = args.get('field' + str(i))
         relation = args.get('rel' + str(i))
         val = args.get('val' + str(i))
         if field is not None and relation is not None and val is not None:
-            constraint = construct_constraint_query(field.strip(), relation.strip(), val.strip())
+            constraint = construct_constraint_query(field.strip(),
+                                                    relation.strip(),
+                                                    val.strip(),
+                                                    index=headline_index)
             conditions.append(constraint)
 
+    # Results of all the methods of an article as a JSON object, e.g. {"Base": "...", "Gold": null}
+    method_to_result = db \
+        .session \
+        .query(func.json_object_agg(GenerationResult.method_name, GenerationResult.result)) \
+        .filter(GenerationResult.article_id == HumanEvaluation.article_id) \
+        .correlate(HumanEvaluation) \
+        .as_scalar() \
+        .label('method_to_result')
+
     q = db \
         .session \
         .query(HumanEvaluation.article_id,
@@ -146,38 +231,54 @@ def list_targets_of_human_evaluation(is_debug: bool) -> flask.Response:
                func.to_char(in_jst(Headline.t), 'YYYY-MM-DD HH24:MI').label('jst')) \
         .outerjoin(Headline,
                    HumanEvaluation.article_id == Headline.article_id) \
-        .filter(Headline.is_used.is_(True), *conditions) \
-        .order_by(Headline.t)
+        .filter(Headline.is_used.is_(True), *conditions)
 
-    n_results = q.count()
+    # Counts are shared by the workers until an evaluation is written
+    key = count_cache_key(args, config.data_version)
+    n_results = webapp_cache.get(key)
+    if n_results is MISSING:
+        n_results = q.count()
+        webapp_cache.put(key, n_results)
+
+    # Pages are sought by `(t, article_id)` of the first or last row instead of an offset,
+    # and one more row than a page tells whether there is a page beyond
     per_page = config.n_items_per_page
+    position = tuple_(Headline.t, Headline.article_id)
+    if cursor is None:
+        q = q.order_by(Headline.t, Headline.article_id)
+    elif cursor.is_forward:
+        q = q.filter(position > cursor.key).order_by(Headline.t, Headline.article_id)
+    else:
+        q = q.filter(position < cursor.key).order_by(Headline.t.desc(), Headline.article_id.desc())
+    rows = q.add_columns(Headline.t, method_to_result).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if cursor is not None and not cursor.is_forward:
+        rows.reverse()
+
+    offset = 0 if cursor is None else cursor.offset
+    has_prev = len(rows) > 0 and cursor is not None and (cursor.is_forward or has_more)
+    has_next = len(rows) > 0 and (has_more if cursor is None or cursor.is_forward else True)
+    # Going back past deleted rows can leave fewer rows than a page before the first one
+    if not has_prev:
+        offset = 0
+
     articles = []
-    for h in q.limit(per_page).offset((page - 1) * per_page).all():
+    for h in rows:
         method_names = ['Gold'] if h.ordering is None else h.ordering
         if is_debug:
             method_names = order_method_names_for_debug(method_names)
 
+        results = {} if h.method_to_result is None else h.method_to_result
         eval_targets = []
         for method_name in method_names:
-            res = db \
-                .session \
-                .query(GenerationResult.article_id,
-                       GenerationResult.result,
-                       GenerationResult.correctness) \
-                .filter(GenerationResult.article_id == h.article_id,
-                        GenerationResult.method_name == method_name) \
-                .one_or_none()
-
-            if res is None:
-                et = EvalTarget(method_name, h.gold_result, None) \
-                     if method_name == 'Gold' \
-                     else EvalTarget(method_name, '', None)
-            else:
-                text = h.gold_result \
-                    if method_name == 'Gold' \
-                    else res.result
-                et = EvalTarget(method_name, text, is_debug)
-                eval_targets.append(et)
+            # Methods without a result are not listed
+            if method_name not in results:
+                continue
+            text = h.gold_result \
+                if method_name == 'Gold' \
+                else results[method_name]
+            eval_targets.append(EvalTarget(method_name, text, is_debug))
 
         is_finished = \
             len(list(config.result.keys()) + ['Gold']) == \
@@ -195,16 +296,22 @@ def list_targets_of_human_evaluation(is_debug: bool) -> flask.Response:
                         is_finished)
         articles.append(e)
 
-    if n_results == 0:
+    if len(rows) == 0:
         display_msg = 'No headline is found'
     else:
-        offset = (page - 1) * per_page + 1
-        end = offset + per_page - 1 if page < (n_results // per_page) else n_results
-        display_msg = 'Displaying {:,} to {:,} of {:,}'.format(offset, end, n_results)
-
-    pagination = DummyPagination(has_prev=page > 1,
-                                 has_next=page < (n_results // per_page),
-                                 display_msg=display_msg)
+        display_msg = 'Displaying {:,} to {:,} of {:,}'.format(offset + 1, offset + len(rows), n_results)
+
+    prev_cursor = Cursor(rows[0].t, rows[0].article_id, False, max(0, offset - per_page)).encode() \
+        if has_prev \
+        else None
+    next_cursor = Cursor(rows[-1].t, rows[-1].article_id, True, offset + len(rows)).encode() \
+        if has_next \
+        else None
+    pagination = DummyPagination(has_prev=has_prev,
+                                 has_next=has_next,
+                                 display_msg=display_msg,
+                                 prev_cursor=prev_cursor,
+                                 next_cursor=next_cursor)
 
     return flask.render_template('list_human_evaluation.pug',
                                  title='debug' if is_debug else 'human-evaluation',
@@ -268,6 +375,7 @@ def article_evaluation(article_id: str,
         e.correctness = form.get('correctness-{}'.format(nth['Ours']))
 
         db.session.commit()
+        webapp_cache.delete_prefix(COUNT_CACHE_PREFIX)
 
         referrer = flask.request.form.get('referrer', '/')
         return flask.redirect(referrer)
@@ -281,7 +389,11 @@ def article_evaluation(article_id: str,
             .filter(Headline.article_id == article_id) \
             .one()
 
-        ric_tables = create_ric_tables(db.session, config.rics, ric_to_ric_info, headline.t)
+        ric_tables = create_ric_tables(db.session,
+                                       config.rics,
+                                       load_ric_to_ric_info(),
+                                       headline.t,
+                                       config.data_version)
         group_size = 3
         while len(ric_tables) % 3 != 0:
             ric_tables.append(Table('', '', '', [], is_dummy=True))
@@ -337,6 +449,12 @@ def article_evaluation(article_id: str,
 @app.route('/data/<string:article_id>')
 def data(article_id: str) -> flask.Response:
 
+    rics = [Code.N225.value, Code.TOPIX.value]
+    etag = compute_etag(config.data_version, ','.join(rics), article_id)
+    response = not_modified(etag, config.http_max_age)
+    if response is not None:
+        return response
+
     headline = db \
         .session \
         .query(Headline, in_utc(Headline.t).label('utc')) \
@@ -344,7 +462,7 @@ def data(article_id: str) -> flask.Response:
         .one()
 
     data = []
-    for ric in [Code.N225.value, Code.TOPIX.value]:
+    for ric in rics:
 
         end = headline.utc.replace(tzinfo=UTC)
         start = datetime(end.year, end.month, end.day, 0, 0, tzinfo=UTC)
@@ -359,20 +477,22 @@ def data(article_id: str) -> flask.Response:
         data.append({
             'ric': ric,
             'chart': {
-                'xs': xs,
-                'ys': ys,
+                'xs': xs.tolist(),
+                'ys': to_json_list(ys),
                 'title': '{} {}'.format(ric, end.strftime('%Y-%m-%d'))
             },
             'chart-prev': {
-                'xs': xs_prev,
-                'ys': ys_prev,
+                'xs': xs_prev.tolist(),
+                'ys': to_json_list(ys_prev),
                 'title': '{} {}'.format(ric, end_prev.strftime('%Y-%m-%d'))
             }
         })
 
-    return app.response_class(response=flask.json.dumps(data),
-                              status=http.HTTPStatus.OK,
-                              mimetype='application/json')
+    return with_etag(app.response_class(response=flask.json.dumps(data),
+                                        status=http.HTTPStatus.OK,
+                                        mimetype='application/json'),
+                     etag,
+                     config.http_max_age)
 
 
 @app.route('/human-evaluation')
@@ -411,43 +531,78 @@ def demo() -> flask.Response:
 
 @app.route('/data_ts/<string:timestamp>')
 def data_ts(timestamp: str) -> flask.Response:
-    start = datetime.fromtimestamp(int(timestamp), JST)
-    one_day = timedelta(days=1)
-    end = start + one_day - timedelta(seconds=1)
-    day_before = start - one_day
-
     rics = config.rics
-
-    # PostgreSQL-specific speedup (raw query)
-    if db.session.bind.dialect.name == 'postgresql':
-        prices = fetch_all_points_fast(db.session, rics, start, end)
-        closes = fetch_all_closes_fast(db.session, rics, day_before, start)
-    else:
-        prices = {}
-        closes = {}
-        for ric in rics:
-            xs, ys = fetch_points(db.session, ric, start, end)
-            prices[ric] = {
-                'xs': [epoch(x) for x in xs],
-                'ys': [float(y) if y is not None else None for y in ys],
-            }
-            closes[ric] = fetch_close(db.session, ric, day_before)
-
-    data = {
-        'start': start.timestamp(),
-        'end': end.timestamp(),
-        'prices': prices,
-        'closes': closes,
-    }
-    return app.response_class(response=flask.json.dumps(data),
-                              status=http.HTTPStatus.OK,
-                              mimetype='application/json')
+    # Old clients accept anything and keep receiving JSON
+    mimetype = negotiate()
+    etag = compute_etag(config.data_version, ','.join(rics), str(int(timestamp)), mimetype)
+    response = not_modified(etag, config.http_max_age)
+    if response is not None:
+        response.vary.add('Accept')
+        return response
+
+    key = day_chart_key(config.data_version, rics, int(timestamp), mimetype)
+    payload = chart_cache.get(key)
+    if payload is MISSING:
+        payload = build_day_chart(db.session, rics, int(timestamp), mimetype)
+        chart_cache.put(key, payload)
+    chart_warmer.submit(int(timestamp))
+
+    response = with_etag(app.response_class(response=payload,
+                                            status=http.HTTPStatus.OK,
+                                            mimetype=mimetype),
+                         etag,
+                         config.http_max_age)
+    response.vary.add('Accept')
+    return response
+
+
+@app.route('/data_range')
+def data_range() -> flask.Response:
+    args = flask.request.args
+    try:
+        start = int(args['start'])
+        end = int(args['end'])
+        n_points = int(args.get('n', config.range_n_points))
+    except (KeyError, ValueError):
+        flask.abort(http.HTTPStatus.BAD_REQUEST)
+    rics = args['rics'].split(',') \
+        if args.get('rics') \
+        else config.rics
+    method = args.get('method', 'lttb')
+    if start >= end or n_points < 3 or method not in DOWNSAMPLERS:
+        flask.abort(http.HTTPStatus.BAD_REQUEST)
+    n_points = min(n_points, config.range_max_points)
+
+    etag = compute_etag(config.data_version, ','.join(rics), str(start), str(end), str(n_points), method)
+    response = not_modified(etag, config.http_max_age)
+    if response is not None:
+        return response
+
+    data = fetch_range_chart(db.session,
+                             rics,
+                             datetime.fromtimestamp(start, JST),
+                             datetime.fromtimestamp(end, JST),
+                             n_points,
+                             method)
+    return with_etag(app.response_class(response=flask.json.dumps(data),
+                                        status=http.HTTPStatus.OK,
+                                        mimetype='application/json'),
+                     etag,
+                     config.http_max_age)
 
 
 @app.route('/predict/<string:ric>/<string:timestamp>')
 def predict(ric: str, timestamp: str) -> flask.Response:
     time = datetime.fromtimestamp(int(timestamp), JST)
-    sentence = predictor.predict(time.strftime(NIKKEI_DATETIME_FORMAT), ric)
+    sentence = predictor.predict(ric, time)
     return app.response_class(response=flask.json.dumps(sentence),
                               status=http.HTTPStatus.OK,
                               mimetype='application/json')
+
+
+@app.route('/status/memory')
+def status_memory() -> flask.Response:
+    data = {'pid': os.getpid(), 'mb': memory_usage_mb()}
+    return app.response_class(response=flask.json.dumps(data),
+                              status=http.HTTPStatus.OK,
+                              mimetype='application/json')
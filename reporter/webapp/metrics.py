@@ -0,0 +1,140 @@
+import http
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Union
+
+import flask
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+from reporter.database.instrument import QueryRecorder
+
+# The uwsgi workers write their samples to files in this directory, which `/metrics` sums up.
+# It has to be set before `prometheus_client` is imported, e.g. by `env` of `envs/uwsgi.ini`.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.environ.get('prometheus_multiproc_dir'))
+
+
+def reset_multiproc_dir() -> None:
+    '''Remove the samples of the previous run
+
+    Metrics without labels create their files as soon as they are defined,
+    so the directory is reset on import, before the definitions below.
+    With `lazy-apps = false`, this module is imported once by the uwsgi master before forking the workers.
+    '''
+    if MULTIPROC_DIR is None:
+        return
+    shutil.rmtree(MULTIPROC_DIR, ignore_errors=True)
+    Path(MULTIPROC_DIR).mkdir(parents=True, exist_ok=True)
+
+
+reset_multiproc_dir()
+
+
+REQUESTS = Counter('reporter_http_requests_total',
+                   'HTTP requests',
+                   ['route', 'method', 'status'])
+REQUEST_SECONDS = Histogram('reporter_http_request_duration_seconds',
+                            'Latency of HTTP requests',
+                            ['route'])
+DB_QUERIES = Histogram('reporter_db_queries_per_request',
+                       'Database queries issued by an HTTP request',
+                       ['route'],
+                       buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+DB_SECONDS = Histogram('reporter_db_duration_seconds_per_request',
+                       'Time spent in database queries by an HTTP request',
+                       ['route'])
+INFERENCE_SECONDS = Histogram('reporter_inference_duration_seconds',
+                              'Latency of a batch of predictions')
+INFERENCE_BATCH_SIZE = Histogram('reporter_inference_batch_size',
+                                 'Queries predicted in a batch',
+                                 buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+CACHE_LOOKUPS = Counter('reporter_cache_lookups_total',
+                        'Lookups of caches, whose hit ratio is hit / (hit + miss)',
+                        ['cache', 'result'])
+
+
+def observe_inference(batch_size: int, seconds: float) -> None:
+    INFERENCE_BATCH_SIZE.observe(batch_size)
+    INFERENCE_SECONDS.observe(seconds)
+
+
+class CacheReporter:
+    '''Count the hits and misses of caches since the last report of this process
+
+    The caches keep their own counters, which are turned into increments of a Prometheus counter.
+    '''
+
+    def __init__(self, get_caches: Callable[[], Dict[str, Any]]):
+
+        self.get_caches = get_caches
+        self.reported = dict()
+        self.lock = threading.Lock()
+
+    def report(self) -> None:
+        with self.lock:
+            for (name, cache) in self.get_caches().items():
+                (prev_hits, prev_misses) = self.reported.get(name, (0, 0))
+                (hits, misses) = (cache.hits, cache.misses)
+                # A reloaded cache starts counting from zero again
+                if hits < prev_hits or misses < prev_misses:
+                    (prev_hits, prev_misses) = (0, 0)
+                CACHE_LOOKUPS.labels(name, 'hit').inc(hits - prev_hits)
+                CACHE_LOOKUPS.labels(name, 'miss').inc(misses - prev_misses)
+                self.reported[name] = (hits, misses)
+
+
+def route_of_request() -> str:
+    rule = flask.request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def install_metrics(app: flask.Flask,
+                    recorder: QueryRecorder,
+                    get_caches: Callable[[], Dict[str, Any]]) -> None:
+    '''Measure the requests of ``app`` and their queries recorded by ``recorder``, and serve them at `/metrics`
+    '''
+    cache_reporter = CacheReporter(get_caches)
+
+    @app.before_request
+    def start_measuring() -> None:
+        flask.g.request_start = time.perf_counter()
+        flask.g.query_stats = recorder.begin('{} {}'.format(flask.request.method, route_of_request()))
+
+    @app.after_request
+    def finish_measuring(response: flask.Response) -> flask.Response:
+        if 'request_start' not in flask.g:
+            return response
+        route = route_of_request()
+        REQUESTS.labels(route, flask.request.method, response.status_code).inc()
+        REQUEST_SECONDS.labels(route).observe(time.perf_counter() - flask.g.request_start)
+        DB_QUERIES.labels(route).observe(flask.g.query_stats.count)
+        DB_SECONDS.labels(route).observe(flask.g.query_stats.seconds)
+        cache_reporter.report()
+        return response
+
+    @app.teardown_request
+    def end_unit(exception: Union[BaseException, None]) -> None:
+        # Also reached when the view raises and `after_request` is skipped
+        if 'query_stats' in flask.g and recorder.current() is flask.g.query_stats:
+            recorder.end()
+
+    @app.route('/metrics')
+    def metrics() -> flask.Response:
+        if MULTIPROC_DIR is None:
+            registry = REGISTRY
+        else:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return app.response_class(response=generate_latest(registry),
+                                  status=http.HTTPStatus.OK,
+                                  content_type=CONTENT_TYPE_LATEST)
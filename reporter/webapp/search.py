@@ -1,12 +1,70 @@
-from sqlalchemy import not_
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Union
+
+from sqlalchemy import String, and_, any_, func, literal, not_
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Query
 
 from reporter.database.model import Headline, HumanEvaluation
+from reporter.webapp.index import (
+    INDEXED_FIELDS,
+    HeadlineIndex,
+    LazyHeadlineIndex
+)
+
+
+def in_article_ids(article_ids: List[str]) -> Query:
+    # One array parameter instead of a parameter per ID
+    return Headline.article_id == any_(literal(article_ids, postgresql.ARRAY(String)))
+
+
+def construct_indexed_constraint_query(field: str,
+                                       relation: str,
+                                       condition: str,
+                                       index: Union[HeadlineIndex, LazyHeadlineIndex]) -> Union[Query, None]:
+    '''A constraint on `simple_headline` or `tag_tokens` answered by ``index``
+
+    Return ``None`` for relations the index does not answer,
+    and for patterns with escapes, which are left to `LIKE`.
+    '''
+    if relation in ['like', 'not like'] and '\\' not in condition:
+        query = in_article_ids(index.like(field, condition))
+    elif field == 'tag_tokens' and relation in ['=', '!=']:
+        query = in_article_ids(index.has_token(condition))
+    else:
+        return None
+    # As in SQL, a negation does not match NULL
+    return query \
+        if relation in ['like', '='] \
+        else and_(getattr(Headline, field).isnot(None), not_(query))
+
+
+def construct_constraint_query(field: str,
+                               relation: str,
+                               condition: str,
+                               index: Union[HeadlineIndex, LazyHeadlineIndex, None] = None) -> Query:
 
+    if field in INDEXED_FIELDS and index is not None:
+        query = construct_indexed_constraint_query(field, relation, condition, index)
+        if query is not None:
+            return query
 
-def construct_constraint_query(field: str, relation: str, condition: str) -> Query:
+    if field == 'tag_tokens':
+        # An array is matched by its elements and by the tokens joined by spaces
+        if relation == '=':
+            return Headline.tag_tokens.any(condition)
+        elif relation == '!=':
+            return not_(Headline.tag_tokens.any(condition))
+        elif relation in ['like', 'not like']:
+            query = func.array_to_string(Headline.tag_tokens, ' ').like(condition)
+            return query if relation == 'like' else not_(query)
 
-    table = Headline if field in ['article_id', 't', 'phase', 'headline'] else HumanEvaluation
+    table = Headline \
+        if field in ['article_id', 't', 'phase', 'headline'] + INDEXED_FIELDS \
+        else HumanEvaluation
 
     if relation == '=':
         return getattr(table, field) == condition
@@ -30,3 +88,52 @@ def construct_constraint_query(field: str, relation: str, condition: str) -> Que
         return getattr(table, field).isnot(None)
     else:
         return True
+
+
+class Cursor:
+    '''A position in a list ordered by `(Headline.t, article_id)`
+
+    ``is_forward`` tells whether the page starts after the position or ends before it,
+    and ``offset`` is the number of rows before the page, which is only used for display.
+
+    >>> cursor = Cursor.decode(Cursor(datetime(2018, 1, 4), 'TDSKDBDGXLASFL04H01', True, 50).encode())
+    >>> (cursor.key, cursor.is_forward, cursor.offset)
+    ((datetime.datetime(2018, 1, 4, 0, 0), 'TDSKDBDGXLASFL04H01'), True, 50)
+    '''
+
+    def __init__(self, t: datetime, article_id: str, is_forward: bool, offset: int):
+
+        self.t = t
+        self.article_id = article_id
+        self.is_forward = is_forward
+        self.offset = offset
+
+    @property
+    def key(self) -> Tuple[datetime, str]:
+        return (self.t, self.article_id)
+
+    def encode(self) -> str:
+        s = json.dumps([self.t.isoformat(), self.article_id, self.is_forward, self.offset])
+        return base64.urlsafe_b64encode(s.encode()).decode()
+
+    @staticmethod
+    def decode(s: str) -> Union['Cursor', None]:
+        '''Return ``None`` for a malformed cursor
+        '''
+        try:
+            (t, article_id, is_forward, offset) = json.loads(base64.urlsafe_b64decode(s.encode()).decode())
+            return Cursor(datetime.fromisoformat(t), str(article_id), bool(is_forward), int(offset))
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            return None
+
+
+COUNT_CACHE_PREFIX = 'count:'
+
+
+def count_cache_key(args: Dict[str, Any], data_version: str) -> str:
+    '''A key of the number of rows matching the constraints given by `field0..4`, `rel0..4`, and `val0..4`
+
+    ``data_version`` is changed after inserting headlines, which makes the counts of the previous data unused.
+    '''
+    constraints = [[args.get(name + str(i)) for name in ['field', 'rel', 'val']] for i in range(5)]
+    return '{}{}:{}'.format(COUNT_CACHE_PREFIX, data_version, json.dumps(constraints))
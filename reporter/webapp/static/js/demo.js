@@ -18,12 +18,34 @@ async function chartClickedHandler(evt) {
   subheading.textContent = `${ric}, ${label}`;
 }
 
+// See `reporter.webapp.wire.encode_compact` for the layout
+function decodeCompact(buffer) {
+  const view = new DataView(buffer);
+  const headerLength = view.getUint32(0, true);
+  const header = JSON.parse(new TextDecoder('utf-8').decode(new Uint8Array(buffer, 4, headerLength)));
+  const xs = Array.from({ length: header.n }, (_, i) => header.x0 + i * header.step);
+
+  const prices = {};
+  header.rics.forEach((ric, i) => {
+    const offset = 4 + headerLength + 4 * header.n * i;
+    const ys = Array.from({ length: header.n }, (_, j) => {
+      const y = view.getFloat32(offset + 4 * j, true);
+      return Number.isNaN(y) ? null : y;
+    });
+    prices[ric] = { xs, ys };
+  });
+
+  return { start: header.start, end: header.end, prices, closes: header.closes };
+}
+
 async function datePickedHandler(formattedDate, date, inst) {
   if (!date) return;
 
   const timestamp = Math.round(date.getTime() / 1000);
-  const response = await fetch(`/data_ts/${timestamp}`);
-  const { start, end, prices, closes } = await response.json();
+  const response = await fetch(`/data_ts/${timestamp}`, {
+    headers: { 'Accept': 'application/octet-stream' }
+  });
+  const { start, end, prices, closes } = decodeCompact(await response.arrayBuffer());
 
   Object.keys(prices).forEach(ric => {
     const ricVals = prices[ric];
@@ -12,7 +12,7 @@ function draw(canvas, ric, data, minY, maxY) {
   let chart = new Chart(ctx, {
     type: 'line',
     data: {
-      labels: data['xs'],
+      labels: data['xs'].map(x => new Date(x * 1000)),
       datasets: [{
         label: ric,
         borderColor: '#ff0039',
@@ -27,9 +27,8 @@ function draw(canvas, ric, data, minY, maxY) {
       tooltips: {
         callbacks: {
           title: (tooltipItem, data) => {
-            const label = tooltipItem[0].xLabel.replace('GMT', 'Z');
-            const m = moment(label, 'ddd, DD MMM YYYY HH:mm:ss Z');
-            return m.tz('Asia/Tokyo').format('YYYY-MM-DD HH:mm') + ' JST';
+            const label = tooltipItem[0].xLabel;
+            return moment(label).tz('Asia/Tokyo').format('YYYY-MM-DD HH:mm') + ' JST';
           }
         }
       },
@@ -139,10 +138,10 @@ document.addEventListener('DOMContentLoaded', () => {
         let canvasPrev = document.createElement('canvas');
         canvasPrev.id = 'canvas-prev-' + i.toString();
 
-        const minY = Math.min(Math.min(...ys.filter(Boolean).map(parseFloat)),
-                              Math.min(...ysPrev.filter(Boolean).map(parseFloat)));
-        const maxY = Math.max(Math.max(...ys.filter(Boolean).map(parseFloat)),
-                              Math.max(...ysPrev.filter(Boolean).map(parseFloat)));
+        const minY = Math.min(Math.min(...ys.filter(Boolean)),
+                              Math.min(...ysPrev.filter(Boolean)));
+        const maxY = Math.max(Math.max(...ys.filter(Boolean)),
+                              Math.max(...ysPrev.filter(Boolean)));
         const scale = maxY - minY;
 
         draw(canvas, ric, response['chart'], minY - 0.1 * scale, maxY + 0.1 * scale);
@@ -10,7 +10,9 @@ function addCondition(queryField, queryRelation, queryVal) {
     't',
     'phase',
     'note',
-    'is_target'
+    'is_target',
+    'simple_headline',
+    'tag_tokens'
   ];
   const fields = fieldsHumanEvaluation;
   fields.forEach(field => {
@@ -95,7 +97,7 @@ function search() {
   let uri = new URI();
   let fieldset = document.getElementById('fieldset');
   let groups = fieldset.querySelectorAll('.form-group');
-  uri = uri.removeSearch('page');
+  uri = uri.removeSearch('cursor');
   [0, 1, 2, 3, 4].forEach(i => {
     uri = uri
       .removeSearch('field' + i)
@@ -138,19 +140,9 @@ document.addEventListener('DOMContentLoaded', () => {
     addCondition('article_id', '=', '');
   }
 
-  let current_page = 'page' in q ? q['page'] : 1;
-
-  let prev_page = parseInt(current_page, 10) - 1;
-  document.querySelectorAll('.jump-to-prev').forEach(element => {
-    if (!element.disabled) {
-      element.href = uri.setSearch({'page': prev_page.toString()});
-    }
-  });
-
-  let next_page = parseInt(current_page, 10) + 1;
-  document.querySelectorAll('.jump-to-next').forEach(element => {
-    if (!element.disabled) {
-      element.href = uri.setSearch({'page': next_page.toString()});
+  document.querySelectorAll('.jump-to-prev, .jump-to-next').forEach(element => {
+    if (element.dataset.cursor) {
+      element.href = uri.clone().setSearch({'cursor': element.dataset.cursor});
     }
   });
 
@@ -2,12 +2,15 @@ import csv
 import json
 from datetime import datetime
 from decimal import Decimal
+from functools import lru_cache
+from itertools import groupby
 from pathlib import Path
 from typing import Dict, List, Tuple, Union
 
 from sqlalchemy.orm.session import Session
+from sqlalchemy.sql import text
 
-from reporter.database.model import Close, Price
+from reporter.util.cache import MISSING, LRUCache
 
 
 class RICInfo:
@@ -39,6 +42,7 @@ class Table:
         self.is_dummy = is_dummy
 
 
+@lru_cache(maxsize=None)
 def load_ric_to_ric_info() -> Dict[str, RICInfo]:
     with Path('resources', 'stock-exchanges.json').open(mode='r') as f:
         stock_exchange = json.load(f)
@@ -55,44 +59,80 @@ def load_ric_to_ric_info() -> Dict[str, RICInfo]:
     return result
 
 
+def format_rows(results: List[Tuple[datetime, Decimal]]) -> List[Tuple[str, str, str]]:
+    '''Format closes in descending order of time, with the movement from the previous one
+
+    >>> format_rows([(datetime(2018, 10, 3, 6, 0), Decimal('101')), (datetime(2018, 10, 2, 6, 0), Decimal('100'))])
+    [('2018-10-03 06:00', '101.00', '↑'), ('2018-10-02 06:00', '100.00', '-')]
+    '''
+    DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+    EPSILON = 1e-2
+
+    formatted_rows = []
+    for ((t, v), prev) in zip(results, results[1:] + [None]):
+        if prev is None:
+            indicator = '-'
+        elif abs(v - prev[1]) < EPSILON:
+            indicator = '→'
+        elif v > prev[1]:
+            indicator = '↑'
+        else:
+            indicator = '↓'
+        formatted_rows.append((t.strftime(DATETIME_FORMAT), '{:,.2f}'.format(v), indicator))
+    return formatted_rows
+
+
+def fetch_last_closes(session: Session,
+                      rics: List[str],
+                      timestamp: datetime,
+                      n_days: int) -> Dict[str, List[Tuple[datetime, Decimal]]]:
+    '''The last ``n_days`` closes until ``timestamp`` of every RIC in one query
+    '''
+    sql = text("""
+               SELECT rics.ric, last_closes.t, last_closes.val
+               FROM unnest(:rics) AS rics (ric)
+               CROSS JOIN LATERAL
+               (SELECT closes.t, prices.val
+                FROM closes
+                JOIN prices ON prices.ric = closes.ric AND prices.t = closes.t
+                WHERE closes.ric = rics.ric AND closes.t <= :timestamp
+                ORDER BY closes.t DESC
+                LIMIT :n_days) last_closes
+               ORDER BY rics.ric, last_closes.t DESC
+               """)
+    result = session.execute(sql, {'rics': list(rics), 'timestamp': timestamp, 'n_days': n_days})
+    ric_to_results = {ric: [] for ric in rics}
+    for (ric, rows) in groupby(result, lambda r: r.ric):
+        ric_to_results[ric] = [(r.t, r.val) for r in rows]
+    return ric_to_results
+
+
+# Closes are historical, so the tables of a timestamp change only when the prices are inserted again,
+# after which `data_version` is changed
+ric_tables_cache = LRUCache(maxsize=1024)
+
+
 def create_ric_tables(session: Session,
                       rics: List[str],
                       ric_to_ric_info: Dict[str, RICInfo],
-                      timestamp: datetime) -> List[Table]:
+                      timestamp: datetime,
+                      data_version: str) -> List[Table]:
 
-    DATETIME_FORMAT = '%Y-%m-%d %H:%M'
-    EPSILON = 1e-2
     n_days = 5
 
-    tables = []
-    for ric in rics:
-        ric_info = ric_to_ric_info.get(ric)
-        results = session \
-            .query(Close.t, Price.val) \
-            .join(Price, Close.t == Price.t) \
-            .filter(Close.ric == ric, Close.ric == Price.ric, Close.t <= timestamp) \
-            .order_by(Close.t.desc()) \
-            .limit(n_days) \
-            .all()
-        prev_vals = [v for (_, v) in results][1:] + [Decimal(0)]
-        formatted_rows = []
-        for i, (t, v, diff) in enumerate([(t, v, v - prev_v) for ((t, v), prev_v)
-                                          in zip(results, prev_vals)]):
-
-            if i == len(results) - 1:
-                indicator = '-'
-            elif abs(diff) < EPSILON:
-                indicator = '→'
-            elif diff > 0:
-                indicator = '↑'
-            else:
-                indicator = '↓'
-            formatted_rows.append((t.strftime(DATETIME_FORMAT), '{:,.2f}'.format(v), indicator))
-
-        table = Table(ric,
-                      ric_info.description,
-                      ric_info.currency,
-                      formatted_rows)
-        tables.append(table)
-
-    return tables
+    key = (data_version, tuple(rics), timestamp)
+    tables = ric_tables_cache.get(key)
+    if tables is MISSING:
+        ric_to_results = fetch_last_closes(session, rics, timestamp, n_days)
+        tables = []
+        for ric in rics:
+            ric_info = ric_to_ric_info.get(ric)
+            table = Table(ric,
+                          ric_info.description,
+                          ric_info.currency,
+                          format_rows(ric_to_results[ric]))
+            tables.append(table)
+        ric_tables_cache.put(key, tables)
+
+    # The caller pads the list with dummy tables
+    return list(tables)
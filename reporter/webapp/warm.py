@@ -0,0 +1,217 @@
+import argparse
+import logging
+import os
+import queue
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import Session, sessionmaker
+
+from reporter.database.model import DailyPrice, create_table
+from reporter.database.read import (
+    fetch_adjacent_trading_days,
+    fetch_date_range,
+    fetch_trading_days
+)
+from reporter.database.write import insert_daily_prices
+from reporter.util.cache import MISSING, LRUCache, SQLiteCache
+from reporter.util.config import Config
+from reporter.util.constant import JST
+from reporter.util.logging import create_logger
+from reporter.webapp.chart import (
+    fetch_all_closes_fast,
+    fetch_all_points_fast,
+    fetch_close,
+    fetch_points,
+    to_json_list
+)
+from reporter.webapp.wire import ENCODERS, JSON
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='reporter.webapp.warm')
+    parser.add_argument('--config',
+                        type=str,
+                        dest='dest_config',
+                        metavar='FILENAME',
+                        default='config.toml',
+                        help='specify config file (default: `config.toml`)')
+    parser.add_argument('--start',
+                        type=str,
+                        metavar='YYYY-MM-DD',
+                        help='the first day in JST (default: the first day of prices)')
+    parser.add_argument('--end',
+                        type=str,
+                        metavar='YYYY-MM-DD',
+                        help='the last day in JST (default: the last day of prices)')
+    parser.add_argument('--debug',
+                        dest='is_debug',
+                        action='store_true',
+                        default=False,
+                        help='show detailed messages while execution')
+    return parser.parse_args()
+
+
+def day_chart_key(data_version: str, rics: List[str], timestamp: int, mimetype: str = JSON) -> str:
+    '''
+    >>> day_chart_key('1', ['.N225', '.TOPIX'], 1538492400)
+    'day-chart:1:.N225,.TOPIX:1538492400:application/json'
+    '''
+    return 'day-chart:{}:{}:{}:{}'.format(data_version, ','.join(rics), timestamp, mimetype)
+
+
+def day_to_timestamp(day: date) -> int:
+    '''
+    >>> day_to_timestamp(date(2018, 10, 3))
+    1538492400
+    '''
+    return int(JST.localize(datetime(day.year, day.month, day.day)).timestamp())
+
+
+def fetch_day_chart(session: Session, rics: List[str], timestamp: int) -> Dict[str, Any]:
+    '''The prices of the day from ``timestamp`` and the closes of the day before
+    '''
+    start = datetime.fromtimestamp(timestamp, JST)
+    one_day = timedelta(days=1)
+    end = start + one_day - timedelta(seconds=1)
+    day_before = start - one_day
+
+    # PostgreSQL-specific speedup (raw query)
+    if session.bind.dialect.name == 'postgresql':
+        prices = fetch_all_points_fast(session, rics, start, end)
+        closes = fetch_all_closes_fast(session, rics, day_before, start)
+    else:
+        prices = {}
+        closes = {}
+        for ric in rics:
+            xs, ys = fetch_points(session, ric, start, end, stop=end)
+            prices[ric] = {
+                'xs': xs.tolist(),
+                'ys': to_json_list(ys),
+            }
+            closes[ric] = fetch_close(session, ric, day_before)
+
+    data = {
+        'start': start.timestamp(),
+        'end': end.timestamp(),
+        'prices': prices,
+        'closes': closes,
+    }
+    return data
+
+
+def build_day_chart(session: Session, rics: List[str], timestamp: int, mimetype: str = JSON) -> Union[str, bytes]:
+    return ENCODERS[mimetype](fetch_day_chart(session, rics, timestamp))
+
+
+def warm_day(session: Session, config: Config, cache: SQLiteCache, timestamp: int) -> bool:
+    '''Store the chart of a day in every format unless it is cached, and tell whether it was built
+    '''
+    keys = {mimetype: day_chart_key(config.data_version, config.rics, timestamp, mimetype)
+            for mimetype in ENCODERS.keys()}
+    if all(key in cache for key in keys.values()):
+        return False
+    data = fetch_day_chart(session, config.rics, timestamp)
+    for (mimetype, key) in keys.items():
+        cache.put(key, ENCODERS[mimetype](data))
+    return True
+
+
+class ChartWarmer:
+    '''Build the charts of the trading days next to the requested days on a background thread
+
+    The demo is browsed a day after another, so the next request is likely to hit the cache.
+    '''
+
+    def __init__(self, config: Config, cache: SQLiteCache):
+
+        self.config = config
+        self.cache = cache
+        self.warmed = LRUCache(1024)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+
+    def submit(self, timestamp: int) -> None:
+        if not self.config.warm_adjacent_days:
+            return
+        self._start()
+        self.queue.put(timestamp)
+
+    def _start(self) -> None:
+        # Threads do not survive the fork of a uwsgi worker
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._work, daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def _work(self) -> None:
+        SessionMaker = sessionmaker(bind=create_engine(self.config.db_uri))
+        while True:
+            timestamp = self.queue.get()
+            if self.warmed.get(timestamp) is not MISSING:
+                continue
+            self.warmed.put(timestamp, True)
+
+            session = SessionMaker()
+            try:
+                day = datetime.fromtimestamp(timestamp, JST).date()
+                for adjacent_day in fetch_adjacent_trading_days(session, self.config.rics, day):
+                    warm_day(session, self.config, self.cache, day_to_timestamp(adjacent_day))
+            except Exception:  # the request of the day builds the chart instead
+                logging.getLogger(__name__).exception('failed to warm the days next to {}'.format(timestamp))
+            finally:
+                session.close()
+
+
+def main() -> None:
+
+    args = parse_args()
+    config = Config(args.dest_config)
+    logger = create_logger(config.dir_logs / Path('warm.log'), is_debug=args.is_debug, mode='a')
+
+    cache = SQLiteCache(config.chart_cache_path, config.chart_cache_size, raw=True)
+    engine = create_engine(config.db_uri)
+    create_table(engine, DailyPrice.__table__)
+    session = sessionmaker(bind=engine)()
+    try:
+        logger.info('aggregating the prices of each day')
+        insert_daily_prices(session)
+
+        (min_t, max_t) = fetch_date_range(session)
+        start = min_t.astimezone(JST).date() \
+            if args.start is None \
+            else datetime.strptime(args.start, '%Y-%m-%d').date()
+        end = max_t.astimezone(JST).date() \
+            if args.end is None \
+            else datetime.strptime(args.end, '%Y-%m-%d').date()
+
+        days = fetch_trading_days(session,
+                                  config.rics,
+                                  JST.localize(datetime(start.year, start.month, start.day)),
+                                  JST.localize(datetime(end.year, end.month, end.day)) + timedelta(days=1))
+        if len(days) * len(ENCODERS) > config.chart_cache_size:
+            logger.warning('{} days in {} formats do not fit in `chart_cache_size` ({})'
+                           .format(len(days), len(ENCODERS), config.chart_cache_size))
+
+        n_built = 0
+        for day in days:
+            if warm_day(session, config, cache, day_to_timestamp(day)):
+                n_built += 1
+                logger.debug('{} | built'.format(day))
+        logger.info('{} trading days, {} charts built'.format(len(days), n_built))
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
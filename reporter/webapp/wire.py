@@ -0,0 +1,71 @@
+import json
+import struct
+from typing import Any, Dict
+
+import flask
+import numpy
+
+from reporter.webapp.chart import STEP_SECONDS
+
+JSON = 'application/json'
+COMPACT = 'application/octet-stream'
+
+
+def encode_json(data: Dict[str, Any]) -> str:
+    return json.dumps(data)
+
+
+def encode_compact(data: Dict[str, Any]) -> bytes:
+    '''Pack a day chart into a header and the values as little-endian float32
+
+    The layout is::
+
+        uint32      the length of the header in bytes
+        header      UTF-8 JSON of `start`, `end`, `closes`, `rics`, and the grid `x0`, `step`, `n`
+        padding     spaces up to a multiple of 4 bytes
+        float32[n]  the values of each RIC in the order of `rics`, NaN where no price
+
+    The times on the grid, which the JSON format repeats for every RIC, are `x0 + i * step`.
+
+    >>> body = encode_compact({'start': 0.0, 'end': 599.0, 'closes': {'.N225': 1.0},
+    ...                        'prices': {'.N225': {'xs': [0.0, 300.0], 'ys': [2.0, None]}}})
+    >>> decode_compact(body)['prices']
+    {'.N225': {'xs': [0.0, 300.0], 'ys': [2.0, None]}}
+    '''
+    rics = sorted(data['prices'].keys())
+    first = data['prices'][rics[0]]['xs'] if len(rics) > 0 else []
+    header = {'start': data['start'],
+              'end': data['end'],
+              'closes': data['closes'],
+              'rics': rics,
+              'x0': first[0] if len(first) > 0 else data['start'],
+              'step': STEP_SECONDS,
+              'n': len(first)}
+    encoded_header = json.dumps(header).encode('utf-8')
+    encoded_header += b' ' * (-(4 + len(encoded_header)) % 4)
+
+    values = numpy.array([data['prices'][ric]['ys'] for ric in rics], dtype=numpy.float64) \
+        .reshape(len(rics), len(first)) \
+        .astype('<f4')
+    return struct.pack('<I', len(encoded_header)) + encoded_header + values.tobytes()
+
+
+def decode_compact(body: bytes) -> Dict[str, Any]:
+    '''The inverse of :func:`encode_compact`, with values rounded to float32
+    '''
+    (n_header,) = struct.unpack_from('<I', body)
+    header = json.loads(body[4:4 + n_header].decode('utf-8'))
+    values = numpy.frombuffer(body, dtype='<f4', offset=4 + n_header).reshape(len(header['rics']), header['n'])
+    xs = (header['x0'] + header['step'] * numpy.arange(header['n'], dtype=numpy.float64)).tolist()
+    prices = {ric: {'xs': xs, 'ys': [None if numpy.isnan(y) else y for y in row.astype(numpy.float64).tolist()]}
+              for (ric, row) in zip(header['rics'], values)}
+    return {'start': header['start'], 'end': header['end'], 'prices': prices, 'closes': header['closes']}
+
+
+ENCODERS = {JSON: encode_json, COMPACT: encode_compact}
+
+
+def negotiate() -> str:
+    '''The format a request accepts, which is JSON unless it asks for the compact one
+    '''
+    return flask.request.accept_mimetypes.best_match([JSON, COMPACT], default=JSON)
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+from typing import Generator, Union
+
+import pytest
+from sqlalchemy.engine import Engine
+
+from reporter.database.instrument import QueryRecorder, QueryStats
+
+
+@pytest.fixture
+def query_budget():
+    '''Assert that a block runs at most ``max_queries`` queries on ``engine``, e.g.::
+
+        with query_budget(db_session.bind, 1):
+            fetch_latest_vals_many(db_session, times, rics, seqtypes)
+
+    With ``max_repeats``, no query may run more times than that, which catches queries in a loop.
+    '''
+    @contextmanager
+    def budget(engine: Engine,
+               max_queries: int,
+               max_repeats: Union[int, None] = None) -> Generator[QueryStats, None, None]:
+        recorder = QueryRecorder().attach(engine)
+        try:
+            with recorder.unit('budget') as stats:
+                yield stats
+        finally:
+            recorder.detach(engine)
+
+        assert stats.count <= max_queries, \
+            '{} queries over the budget of {}:\n{}'.format(stats.count,
+                                                           max_queries,
+                                                           '\n'.join(stats.fingerprints.keys()))
+        if max_repeats is not None:
+            assert stats.repeated(max_repeats) == {}
+
+    return budget
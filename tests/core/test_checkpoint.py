@@ -0,0 +1,51 @@
+import random
+
+import torch
+
+from reporter.core.checkpoint import (
+    CheckpointWriter,
+    capture_rng_state,
+    export_flat_weights,
+    map_flat_weights,
+    restore_rng_state
+)
+
+
+def test_checkpoint_writer_takes_snapshot(tmp_path):
+
+    dest = tmp_path / 'reporter.checkpoint'
+    weight = torch.zeros(3)
+    writer = CheckpointWriter()
+    writer.save(dest, {'epoch': 1, 'model': {'weight': weight}})
+    # Training keeps updating parameters in place
+    weight.add_(1.0)
+    writer.close()
+
+    with dest.open(mode='rb') as f:
+        checkpoint = torch.load(f)
+    assert checkpoint['epoch'] == 1
+    assert torch.equal(checkpoint['model']['weight'], torch.zeros(3))
+    assert not (tmp_path / 'reporter.checkpoint.tmp').exists()
+
+
+def test_restore_rng_state():
+
+    state = capture_rng_state()
+    expected = (random.random(), torch.rand(1).item())
+    restore_rng_state(state)
+    assert (random.random(), torch.rand(1).item()) == expected
+
+
+def test_map_flat_weights(tmp_path):
+
+    model = torch.nn.Linear(3, 2)
+    dest = tmp_path / 'reporter.model.flat'
+    export_flat_weights(model.state_dict(), dest)
+
+    other = torch.nn.Linear(3, 2)
+    map_flat_weights(other, dest)
+
+    assert torch.equal(other.weight, model.weight)
+    assert torch.equal(other.bias, model.bias)
+    x = torch.ones(1, 3)
+    assert torch.allclose(other(x), model(x))
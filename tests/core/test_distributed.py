@@ -0,0 +1,15 @@
+from reporter.core.distributed import shard
+
+
+def test_shard():
+
+    batches = list(range(7))
+    assert list(shard(batches, 0, 3)) == [0, 3]
+    assert list(shard(batches, 1, 3)) == [1, 4]
+    assert list(shard(batches, 2, 3)) == [2, 5]
+
+
+def test_shard_single_process():
+
+    batches = list(range(7))
+    assert shard(batches, 0, 1) is batches
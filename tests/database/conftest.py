@@ -0,0 +1,45 @@
+from pathlib import Path
+
+import pytest
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+from reporter.database.model import Base, Close, Instrument, Price, PriceSeq
+from reporter.database.write import insert_prices
+from reporter.util.config import Config
+from reporter.util.logging import create_logger
+
+
+@pytest.fixture(scope='session')
+def config():
+    return Config('config.toml')
+
+
+@pytest.fixture(scope='session')
+def engine(config):
+    return create_engine(config.db_uri)
+
+
+@pytest.fixture(scope='session')
+def db_session(config, engine):
+    tables = [
+        Close.__table__,
+        Instrument.__table__,
+        Price.__table__,
+        PriceSeq.__table__]
+    Base.metadata.drop_all(engine, tables)
+    Base.metadata.create_all(engine, tables)
+
+    Session = sessionmaker(bind=engine)
+
+    session = Session()
+    dir_resources = Path(config.dir_resources)
+    dir_prices = dir_resources / Path('pseudo-data') / Path('prices')
+    missing_rics = ['.TEST']
+    logger = create_logger(Path('test.log'), is_debug=False, is_temporary=True)
+
+    insert_prices(session, dir_prices, missing_rics, dir_resources, logger)
+
+    yield session
+
+    session.close()
@@ -0,0 +1,44 @@
+import csv
+
+import pytest
+from sqlalchemy.orm.session import sessionmaker
+
+from reporter.database.model import Base, GenerationResult, HumanEvaluation
+from reporter.webapp.human_evaluation import populate_for_human_evaluation
+
+
+def write_results(dest, rows):
+    with dest.open(mode='w') as f:
+        writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+        writer.writerow(['article_id', 'gold tokens', 'gold', 'pred tokens', 'pred'])
+        for (article_id, tokens) in rows:
+            writer.writerow([article_id, '', '', '', '|'.join(tokens + ['</s>'])])
+
+
+@pytest.fixture
+def evaluation_session(engine):
+    tables = [GenerationResult.__table__, HumanEvaluation.__table__]
+    Base.metadata.drop_all(engine, tables)
+    Base.metadata.create_all(engine, tables)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    Base.metadata.drop_all(engine, tables)
+
+
+def test_populate_for_human_evaluation(tmp_path, evaluation_session):
+
+    n = 150
+    base = tmp_path / 'base.csv'
+    ours = tmp_path / 'ours.csv'
+    # The last article has no result of any method
+    write_results(ours, [('A{}'.format(i), ['日経平均', '続落']) for i in range(n - 1)] + [('A{}'.format(n - 1), [])])
+    write_results(base, [('A{}'.format(i), ['日経平均', '反落']) for i in range(n - 1)] + [('A{}'.format(n - 1), [])])
+
+    populate_for_human_evaluation(evaluation_session, {'Base': base, 'Ours': ours, 'Missing': tmp_path / 'no.csv'})
+
+    assert evaluation_session.query(GenerationResult).count() == 3 * n
+    evaluations = evaluation_session.query(HumanEvaluation).all()
+    assert len(evaluations) == n - 1
+    assert all(sorted(e.ordering) == ['Base', 'Gold', 'Missing', 'Ours'] for e in evaluations)
+    assert sum(1 for e in evaluations if e.is_target) == 100
@@ -0,0 +1,41 @@
+import logging
+
+from sqlalchemy.engine import create_engine
+
+from reporter.database.instrument import QueryRecorder, fingerprint
+
+
+def test_fingerprint_ignores_values():
+    assert fingerprint("SELECT * FROM prices WHERE ric = '.N225' AND t < 10") == \
+        fingerprint("SELECT * FROM prices WHERE ric = '.TOPIX' AND t < 20")
+    assert fingerprint('SELECT * FROM prices WHERE ric IN (?, ?)') == \
+        fingerprint('SELECT * FROM prices WHERE ric IN (?)')
+
+
+def test_recorder_warns_queries_in_a_loop(caplog):
+
+    engine = create_engine('sqlite://')
+    recorder = QueryRecorder(logging.getLogger(__name__), warn_threshold=2).attach(engine)
+
+    # Not recorded outside of units
+    engine.execute('SELECT 0')
+
+    with recorder.unit('outer') as outer:
+        engine.execute('SELECT 0')
+        with recorder.unit('inner') as inner:
+            for i in range(3):
+                engine.execute('SELECT {}'.format(i + 1))
+
+    assert (outer.count, inner.count) == (4, 3)
+    assert outer.fingerprints == {'SELECT ?': 4}
+    assert recorder.current() is None
+    assert 'inner ran the same query 3 times (N+1?): SELECT ?' in caplog.text
+    assert 'outer ran the same query 4 times (N+1?): SELECT ?' in caplog.text
+
+
+def test_query_budget(query_budget):
+
+    engine = create_engine('sqlite://')
+    with query_budget(engine, 2) as stats:
+        engine.execute('SELECT 1')
+    assert stats.count == 1
@@ -0,0 +1,92 @@
+import itertools
+from datetime import datetime
+from typing import Callable, List
+
+from sqlalchemy import event
+
+from reporter.database.model import Close, Price
+from reporter.database.read import (
+    fetch_latest_vals,
+    fetch_latest_vals_many,
+    fetch_max_t_of_prev_trading_day,
+    fetch_prices_of_a_day
+)
+from reporter.util.constant import JST, UTC, SeqType
+from reporter.webapp.chart import fetch_close
+from reporter.webapp.table import fetch_last_closes
+
+
+def explain(db_session, run: Callable[[], None]) -> List[str]:
+    '''Plans of the statements issued by ``run`` with sequential scans discouraged
+    '''
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db_session.bind, 'before_cursor_execute', before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(db_session.bind, 'before_cursor_execute', before_cursor_execute)
+
+    cursor = db_session.connection().connection.cursor()
+    cursor.execute('SET enable_seqscan = off')
+    plans = []
+    for (statement, parameters) in statements:
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        plans.append('\n'.join(row[0] for row in cursor.fetchall()))
+    cursor.execute('RESET enable_seqscan')
+    cursor.close()
+    return plans
+
+
+def test_fetch_latest_vals_many(db_session, query_budget) -> None:
+    times = [datetime(2011, 1, 14, 6, 0, tzinfo=UTC),
+             datetime(2011, 1, 14, 5, 58, tzinfo=UTC),
+             datetime(2001, 1, 1, 0, 0, tzinfo=UTC)]
+    rics = ['.TEST']
+    seqtypes = [SeqType.RawShort, SeqType.StdLong]
+
+    with query_budget(db_session.bind, 1):
+        result = fetch_latest_vals_many(db_session, times, rics, seqtypes)
+
+    expected = [dict(fetch_latest_vals(db_session, t, ric, seqtype)
+                     for (ric, seqtype) in itertools.product(rics, seqtypes))
+                for t in times]
+    assert result == expected
+    # Nothing within 7 days
+    assert all(vals == [] for vals in result[2].values())
+
+
+def test_day_filters_use_index(db_session) -> None:
+    jst = JST.localize(datetime(2011, 1, 14, 15, 0))
+    t = datetime(2011, 1, 14, 6, 0, tzinfo=UTC)
+
+    plans = explain(db_session, lambda: (fetch_prices_of_a_day(db_session, '.TEST', jst),
+                                         fetch_max_t_of_prev_trading_day(db_session, '.TEST', t),
+                                         fetch_close(db_session, '.TEST', jst)))
+
+    assert len(plans) == 3
+    # The time range is a condition of the index scan rather than a filter over the rows of a RIC
+    (prices, max_t, close) = [[line for line in plan.splitlines() if 'Index Cond:' in line] for plan in plans]
+    assert any('(t >= ' in line and '(t < ' in line for line in prices)
+    assert any('(t < ' in line for line in max_t)
+    assert any('(t >= ' in line and '(t < ' in line for line in close)
+
+
+def test_fetch_last_closes(db_session, query_budget) -> None:
+    t = datetime(2011, 1, 14, 6, 0, tzinfo=UTC)
+
+    with query_budget(db_session.bind, 1):
+        result = fetch_last_closes(db_session, ['.TEST', '.MISSING'], t, 5)
+
+    expected = db_session \
+        .query(Close.t, Price.val) \
+        .join(Price, Close.t == Price.t) \
+        .filter(Close.ric == '.TEST', Close.ric == Price.ric, Close.t <= t) \
+        .order_by(Close.t.desc()) \
+        .limit(5) \
+        .all()
+    assert result['.TEST'] == [tuple(row) for row in expected]
+    assert result['.MISSING'] == []
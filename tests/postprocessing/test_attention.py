@@ -0,0 +1,20 @@
+import numpy
+
+from reporter.postprocessing.attention import AttentionWriter, load_attention
+
+
+def test_attention_writer(tmp_path):
+
+    dest = tmp_path / 'attention-test.npy'
+    writer = AttentionWriter(dest, n_articles=3, n_steps=4, n_rics=2)
+    # Two decoding steps of a batch of two articles
+    writer.write(['a', 'b'], [numpy.array([[0.1, 0.9], [0.2, 0.8]]),
+                              numpy.array([[0.3, 0.7], [0.4, 0.6]])])
+    writer.write(['c'], [numpy.array([[0.5, 0.5]])])
+    writer.close()
+
+    article_id_to_row, weights = load_attention(dest)
+    assert article_id_to_row == {'a': 0, 'b': 1, 'c': 2}
+    assert weights.shape == (3, 4, 2)
+    assert numpy.allclose(weights[article_id_to_row['b'], :2], [[0.2, 0.8], [0.4, 0.6]])
+    assert numpy.allclose(weights[article_id_to_row['c'], 1:], 0.0)
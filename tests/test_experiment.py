@@ -0,0 +1,36 @@
+from reporter.experiment import load_grid
+
+BASE = '''
+[dataset]
+train = ['2010-12-01 00:00:00+0900', '2015-10-01 00:00:00+0900']
+valid = ['2015-10-01 00:00:00+0900', '2016-04-01 00:00:00+0900']
+test = ['2016-04-01 00:00:00+0900', '2016-10-01 00:00:00+0900']
+
+[train]
+learning_rate = 1e-4
+rics = ['.N225']
+'''
+
+GRID = '''
+base = '{}'
+
+[grid]
+'train.learning_rate' = [0.001, 0.01]
+'encoder.enc_hidden_size' = [128]
+'''
+
+
+def test_load_grid(tmp_path):
+
+    dest_base = tmp_path / 'base.toml'
+    dest_base.write_text(BASE)
+    dest_grid = tmp_path / 'grid.toml'
+    dest_grid.write_text(GRID.format(dest_base))
+
+    variants = load_grid(dest_grid)
+    assert [v.name for v in variants] == ['enc_hidden_size-128_learning_rate-0.001',
+                                          'enc_hidden_size-128_learning_rate-0.01']
+    assert [v.config.learning_rate for v in variants] == [0.001, 0.01]
+    assert all(v.config.enc_hidden_size == 128 for v in variants)
+    # The variants differ only in hyperparameters, so they share a dataset
+    assert variants[0].dataset_key == variants[1].dataset_key
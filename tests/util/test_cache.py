@@ -0,0 +1,54 @@
+from reporter.util.cache import MISSING, LRUCache, SQLiteCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is MISSING
+    assert cache.get('c') == 3
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 1}
+
+
+def test_sqlite_cache_is_shared_between_connections(tmp_path):
+
+    dest = tmp_path / 'cache.sqlite3'
+    writer = SQLiteCache(dest, maxsize=2)
+    reader = SQLiteCache(dest, maxsize=2)
+
+    writer.put('model-1:.N225:0', ['日経平均', '反落'])
+    assert reader.get('model-1:.N225:0') == ['日経平均', '反落']
+    assert reader.get('model-1:.N225:300') is MISSING
+
+
+def test_sqlite_cache_evicts_and_deletes_prefix(tmp_path):
+
+    cache = SQLiteCache(tmp_path / 'cache.sqlite3', maxsize=2)
+    cache.put('model-1:a', [1])
+    cache.put('model-1:b', [2])
+    cache.get('model-1:a')
+    cache.put('model-2:c', [3])
+
+    assert len(cache) == 2
+    assert cache.get('model-1:b') is MISSING
+
+    cache.delete_prefix('model-1:')
+    assert cache.get('model-1:a') is MISSING
+    assert cache.get('model-2:c') == [3]
+
+
+def test_sqlite_cache_stores_raw_strings(tmp_path):
+
+    cache = SQLiteCache(tmp_path / 'cache.sqlite3', maxsize=2, raw=True)
+    cache.put('day:0', '{"prices": {}}')
+
+    assert 'day:0' in cache
+    assert 'day:300' not in cache
+    assert cache.get('day:0') == '{"prices": {}}'
+
+    cache.put('day:300', b'\x00\x00\xc0\x7f')
+    assert cache.get('day:300') == b'\x00\x00\xc0\x7f'
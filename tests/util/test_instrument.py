@@ -0,0 +1,40 @@
+import json
+
+from reporter.util.instrument import Instrument, parse_epoch_range
+
+
+def test_record_writes_phases_and_throughput(tmp_path):
+
+    dest = tmp_path / 'reporter.perf.jsonl'
+    instrument = Instrument(dest)
+    for epoch in range(2):
+        with instrument.record(epoch=epoch):
+            with instrument.phase('train'):
+                instrument.count('train.examples', 10)
+                instrument.count('train.tokens', 100)
+            with instrument.phase('checkpoint'):
+                pass
+    instrument.close()
+
+    records = [json.loads(line) for line in dest.read_text().splitlines()]
+    assert [r['epoch'] for r in records] == [0, 1]
+    assert set(records[1]['phases'].keys()) == {'train', 'checkpoint'}
+    # Counters are reset for every record
+    assert records[1]['counters'] == {'train.examples': 10, 'train.tokens': 100}
+    assert list(records[1]['throughput'].keys()) == ['train']
+    assert records[1]['peak_rss_mb'] > 0
+
+
+def test_disabled_instrument_records_nothing():
+
+    instrument = Instrument(None)
+    with instrument.record(epoch=0):
+        with instrument.phase('train'):
+            instrument.count('train.examples', 10)
+    assert not instrument.phases
+    assert not instrument.counters
+
+
+def test_parse_epoch_range():
+    assert parse_epoch_range('2:4') == range(2, 4)
+    assert parse_epoch_range('3') == range(3, 4)
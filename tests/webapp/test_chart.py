@@ -0,0 +1,34 @@
+import numpy
+
+from reporter.webapp.chart import fill_gaps, to_json_list
+
+
+def test_fill_gaps():
+
+    epochs = numpy.array([60., 120., 600., 1260.])
+    vals = numpy.array([1., 2., 3., 4.])
+
+    xs, ys = fill_gaps(epochs, vals, 0., 1500.)
+
+    assert xs.tolist() == [0., 300., 600., 900., 1200., 1500.]
+    # The first value of a step wins
+    assert to_json_list(ys) == [1., None, 3., None, 4., None]
+
+
+def test_fill_gaps_drops_values_out_of_grid():
+
+    epochs = numpy.array([-300., 0., 900.])
+    vals = numpy.array([1., 2., 3.])
+
+    xs, ys = fill_gaps(epochs, vals, 0., 600.)
+
+    assert xs.tolist() == [0., 300., 600.]
+    assert to_json_list(ys) == [2., None, None]
+
+
+def test_fill_gaps_of_no_prices():
+
+    xs, ys = fill_gaps(numpy.empty(0), numpy.empty(0), 0., 600.)
+
+    assert xs.tolist() == [0., 300., 600.]
+    assert numpy.isnan(ys).all()
@@ -0,0 +1,37 @@
+import numpy
+
+from reporter.webapp.downsample import lttb, minmax
+
+
+def test_lttb_keeps_ends_and_peaks():
+
+    xs = numpy.arange(1000, dtype=numpy.float64)
+    ys = numpy.sin(xs / 50)
+    ys[500] = 10.0
+
+    result_xs, result_ys = lttb(xs, ys, 100)
+
+    assert len(result_xs) == 100
+    assert result_xs[0] == 0.0 and result_xs[-1] == 999.0
+    assert (numpy.diff(result_xs) > 0).all()
+    assert 10.0 in result_ys.tolist()
+
+
+def test_lttb_returns_short_series_as_they_are():
+
+    xs = numpy.arange(5, dtype=numpy.float64)
+    result_xs, _ = lttb(xs, xs, 10)
+    assert result_xs.tolist() == xs.tolist()
+
+
+def test_minmax_keeps_extremes_of_each_bucket():
+
+    xs = numpy.arange(1000, dtype=numpy.float64)
+    ys = numpy.random.RandomState(0).randn(1000)
+
+    result_xs, result_ys = minmax(xs, ys, 20)
+
+    assert len(result_xs) <= 20
+    assert (numpy.diff(result_xs) > 0).all()
+    assert ys.min() in result_ys.tolist()
+    assert ys.max() in result_ys.tolist()
@@ -0,0 +1,32 @@
+import http
+
+import flask
+
+from reporter.webapp.etag import compute_etag, not_modified, with_etag
+
+
+def test_not_modified():
+
+    app = flask.Flask(__name__)
+    etag = compute_etag('1', '.N225', '1538492400')
+
+    with app.test_request_context(headers={'If-None-Match': '"{}"'.format(etag)}):
+        response = not_modified(etag, 60)
+        assert response.status_code == http.HTTPStatus.NOT_MODIFIED
+        assert response.headers['ETag'] == '"{}"'.format(etag)
+
+    with app.test_request_context(headers={'If-None-Match': '"{}"'.format(compute_etag('2', '.N225', '1538492400'))}):
+        assert not_modified(etag, 60) is None
+
+    with app.test_request_context():
+        assert not_modified(etag, 60) is None
+
+
+def test_with_etag():
+
+    app = flask.Flask(__name__)
+
+    with app.test_request_context():
+        response = with_etag(app.response_class(response='{}', mimetype='application/json'), 'abc', 60)
+        assert response.headers['ETag'] == '"abc"'
+        assert set(response.headers['Cache-Control'].split(', ')) == {'public', 'max-age=60'}
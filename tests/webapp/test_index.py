@@ -0,0 +1,64 @@
+from reporter.webapp.index import (
+    HeadlineIndex,
+    LazyHeadlineIndex,
+    TextIndex,
+    like_to_regex
+)
+
+
+def test_like_to_regex():
+    assert like_to_regex('日経平均_').fullmatch('日経平均、') is not None
+    assert like_to_regex('日経平均_').fullmatch('日経平均') is None
+    assert like_to_regex('1.5%').fullmatch('105円') is None
+
+
+def test_text_index_like():
+    index = TextIndex(['日経平均、反発', '日経平均、反落', '東証株価指数、反発', '高', None])
+
+    assert index.like('%反発%').tolist() == [0, 2]
+    assert index.like('日経平均%').tolist() == [0, 1]
+    assert index.like('%平均、反_').tolist() == [0, 1]
+    assert index.like('高').tolist() == [3]
+    assert index.like('%続伸%').tolist() == []
+    # Patterns without literals are verified against every text
+    assert index.like('%').tolist() == [0, 1, 2, 3]
+    assert index.like('_').tolist() == [3]
+
+
+def test_text_index_like_verifies_order():
+    # Both texts contain the bigrams, but only one in the order of the pattern
+    index = TextIndex(['反発後に反落', '反落後に反発'])
+    assert index.like('%反発%反落%').tolist() == [0]
+
+
+def test_headline_index():
+    index = HeadlineIndex(['A', 'B', 'C'],
+                          {'simple_headline': ['日経平均、反発', '日経平均、反落', None],
+                           'tag_tokens': ['<start> 日経平均 反発 <end>', '<start> 日経平均 反落 <end>', None]},
+                          [['<start>', '日経平均', '反発', '<end>'], ['<start>', '日経平均', '反落', '<end>'], None])
+
+    assert index.like('simple_headline', '%反落') == ['B']
+    assert index.like('tag_tokens', '% 反発 %') == ['A']
+    assert index.has_token('日経平均') == ['A', 'B']
+    assert index.has_token('続伸') == []
+
+
+def test_lazy_headline_index_follows_version(monkeypatch):
+
+    builds = []
+
+    def build(session):
+        builds.append(session)
+        return HeadlineIndex(['A'], {'simple_headline': ['日経平均、反発'], 'tag_tokens': [None]}, [None])
+
+    monkeypatch.setattr(HeadlineIndex, 'build', staticmethod(build))
+    version = [1]
+    index = LazyHeadlineIndex(lambda: 'session', lambda: version[0])
+
+    assert index.like('simple_headline', '%反発') == ['A']
+    assert index.like('simple_headline', '%反落') == []
+    assert len(builds) == 1
+
+    version[0] = 2
+    index.get()
+    assert len(builds) == 2
@@ -0,0 +1,35 @@
+import threading
+
+import pytest
+
+from reporter.webapp.inference import InferenceWorker
+
+
+def test_inference_worker_batches_concurrent_requests():
+
+    batches = []
+    released = threading.Event()
+
+    def predict_many(queries):
+        batches.append(queries)
+        released.wait(timeout=1.0)
+        return [[t, ric] for (t, ric) in queries]
+
+    worker = InferenceWorker(predict_many, max_batch_size=8, max_wait_ms=200.0)
+    futures = [worker.submit('2018-10-03 09:0{}:00+0900'.format(i % 3), '.N225') for i in range(6)]
+    released.set()
+
+    results = [future.result(timeout=5.0) for future in futures]
+    assert results[4] == ['2018-10-03 09:01:00+0900', '.N225']
+    # The duplicates are predicted once
+    assert sum(len(queries) for queries in batches) == 3
+
+
+def test_inference_worker_delivers_errors():
+
+    def predict_many(queries):
+        raise ValueError('no prices')
+
+    worker = InferenceWorker(predict_many, max_batch_size=8, max_wait_ms=1.0)
+    with pytest.raises(ValueError):
+        worker.submit('2018-10-03 09:00:00+0900', '.N225').result(timeout=5.0)
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import flask
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy.engine import create_engine
+
+from reporter.database.instrument import QueryRecorder
+from reporter.util.cache import LRUCache
+from reporter.webapp.metrics import install_metrics
+
+
+def test_metrics():
+
+    app = flask.Flask(__name__)
+    engine = create_engine('sqlite://')
+    cache = LRUCache(maxsize=2)
+    recorder = QueryRecorder().attach(engine)
+    install_metrics(app, recorder, lambda: {'test': cache})
+
+    @app.route('/items/<string:name>')
+    def items(name: str) -> str:
+        cache.get(name)
+        engine.execute('SELECT 1')
+        engine.execute('SELECT 2')
+        return name
+
+    client = app.test_client()
+    assert client.get('/items/a').status_code == 200
+    body = client.get('/metrics').get_data(as_text=True)
+
+    # The order of labels in the text format differs by the version of `prometheus_client`
+    samples = {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+               for family in text_string_to_metric_families(body)
+               for sample in family.samples}
+    route = '/items/<string:name>'
+    assert samples[('reporter_http_requests_total',
+                    (('method', 'GET'), ('route', route), ('status', '200')))] == 1.0
+    assert samples[('reporter_db_queries_per_request_sum', (('route', route),))] == 2.0
+    assert samples[('reporter_cache_lookups_total', (('cache', 'test'), ('result', 'miss')))] == 1.0
+    # The unit of the request has ended
+    assert recorder.current() is None
+
+
+def test_import_creates_multiproc_dir(tmp_path):
+
+    dest = tmp_path / 'metrics'
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(dest))
+    result = subprocess.run([sys.executable, '-c', 'import reporter.webapp.metrics'],
+                            env=env,
+                            stderr=subprocess.PIPE)
+
+    assert result.returncode == 0, result.stderr.decode()
+    assert dest.is_dir()
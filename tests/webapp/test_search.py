@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from reporter.util.constant import UTC
+from reporter.webapp.search import COUNT_CACHE_PREFIX, Cursor, count_cache_key
+
+
+def test_cursor_round_trip():
+
+    cursor = Cursor(datetime(2018, 1, 4, 0, 5, tzinfo=UTC), 'TDSKDBDGXLASFL04H01', False, 100)
+    result = Cursor.decode(cursor.encode())
+
+    assert result.key == cursor.key
+    assert not result.is_forward
+    assert result.offset == 100
+
+
+def test_malformed_cursor():
+    assert Cursor.decode('not a cursor') is None
+    assert Cursor.decode('W10=') is None
+
+
+def test_count_cache_key_ignores_cursor():
+    args = {'field0': 'phase', 'rel0': '=', 'val0': 'test'}
+    assert count_cache_key(args, '1') == count_cache_key({**args, 'cursor': 'W10='}, '1')
+    assert count_cache_key(args, '1') != count_cache_key({**args, 'val0': 'train'}, '1')
+
+
+def test_count_cache_key_follows_data_version():
+    args = {'field0': 'phase', 'rel0': '=', 'val0': 'test'}
+    assert count_cache_key(args, '1') != count_cache_key(args, '2')
+    assert count_cache_key(args, '2').startswith(COUNT_CACHE_PREFIX)
@@ -0,0 +1,16 @@
+from reporter.util.cache import SQLiteCache
+from reporter.util.config import Config
+from reporter.webapp.warm import day_chart_key, warm_day
+from reporter.webapp.wire import ENCODERS
+
+
+def test_warm_day_skips_cached_days(tmp_path):
+
+    config = Config('config.toml')
+    cache = SQLiteCache(tmp_path / 'cache.sqlite3', maxsize=2, raw=True)
+    for mimetype in ENCODERS.keys():
+        cache.put(day_chart_key(config.data_version, config.rics, 1538492400, mimetype), '{}')
+
+    # A cached day is not built, so no session is needed
+    assert not warm_day(None, config, cache, 1538492400)
+    assert cache.get(day_chart_key(config.data_version, config.rics, 1538492400)) == '{}'
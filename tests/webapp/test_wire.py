@@ -0,0 +1,26 @@
+import struct
+
+from reporter.webapp.wire import decode_compact, encode_compact
+
+
+def test_compact_round_trip():
+
+    data = {'start': 1538492400.0,
+            'end': 1538578799.0,
+            'prices': {'.TOPIX': {'xs': [1538492400.0, 1538492700.0, 1538493000.0], 'ys': [1.5, None, 2.25]},
+                       '.N225': {'xs': [1538492400.0, 1538492700.0, 1538493000.0], 'ys': [None, 3.0, 4.0]}},
+            'closes': {'.N225': 100.0, '.TOPIX': None}}
+
+    body = encode_compact(data)
+
+    (n_header,) = struct.unpack_from('<I', body)
+    # The values are aligned for a Float32Array
+    assert (4 + n_header) % 4 == 0
+    assert len(body) == 4 + n_header + 4 * 2 * 3
+    assert decode_compact(body) == data
+
+
+def test_compact_of_no_prices():
+
+    data = {'start': 0.0, 'end': 86399.0, 'prices': {}, 'closes': {}}
+    assert decode_compact(encode_compact(data)) == data